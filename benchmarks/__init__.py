@@ -0,0 +1,7 @@
+"""
+Benchmarks for the profiles API. Each module is a script run from the repo root, for example:
+
+    python -m benchmarks.bulk_registration --members 500
+
+They create (and afterwards destroy) a throwaway test database, so the dev database is never touched.
+"""
@@ -0,0 +1,105 @@
+"""
+Read throughput and latency as concurrency grows, for the async views (/profiles/async/) on one event loop and for
+the DRF viewset (/profiles/) behind a WSGI worker with one thread per in-flight request (gunicorn gthread).
+Each request is a list page or a retrieve, alternating. --db-latency-ms adds a sleep to every query, standing in for
+the network round trip to a database server that the local SQLite file doesn't have.
+
+    python -m benchmarks.async_load --members 2000 --requests 400 --concurrency 1 4 16 64 --db-latency-ms 2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import seed_profiles, setup_django, test_database, timed
+
+
+def paths(prefix, pks, count):
+    return [
+        f'{prefix}?page_size=20' if index % 2 else f'{prefix}{pks[index % len(pks)]}/'
+        for index in range(count)
+    ]
+
+
+def sync_load(urls, concurrency):
+    from django.test import Client
+
+    def get(url):
+        start = time.perf_counter()
+        response = Client().get(url)
+        assert response.status_code == 200, response.content
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(get, urls))
+
+
+async def async_load(urls, concurrency):
+    from django.test import AsyncClient
+
+    pending = asyncio.Semaphore(concurrency)
+    client = AsyncClient()
+
+    async def get(url):
+        async with pending:
+            start = time.perf_counter()
+            response = await client.get(url)
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(get(url) for url in urls))
+
+
+def report(label, concurrency, latencies, seconds):
+    p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+    print(f'  {label:5} c={concurrency:<3} {len(latencies) / seconds:8.1f} req/s  p95 {p95:8.1f} ms')
+
+
+def run(members, requests, levels, db_latency):
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from users.models import Profile
+
+    def slow_query(execute, sql, params, many, context):
+        time.sleep(db_latency)
+        return execute(sql, params, many, context)
+
+    def add_latency(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow_query)
+
+    with test_database():
+        seed_profiles(members)
+        pks = list(Profile.objects.values_list('pk', flat=True)[:200])
+        if db_latency:
+            connection.ensure_connection()
+            add_latency(None, connection)
+            connection_created.connect(add_latency)
+
+        print(f'{requests} requests per level, {members} profiles, {db_latency * 1000:.1f} ms per query')
+        for concurrency in levels:
+            urls = paths('/profiles/', pks, requests)
+            with timed() as elapsed:
+                latencies = sync_load(urls, concurrency)
+            report('wsgi', concurrency, latencies, elapsed['seconds'])
+
+            urls = paths('/profiles/async/', pks, requests)
+            with timed() as elapsed:
+                latencies = asyncio.run(async_load(urls, concurrency))
+            report('asgi', concurrency, latencies, elapsed['seconds'])
+        connection_created.disconnect(add_latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--db-latency-ms', type=float, default=0)
+    args = parser.parse_args()
+    setup_django()
+    run(args.members, args.requests, args.concurrency, args.db_latency_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compares registering members one POST /profiles/ at a time with one POST /profiles/bulk/ for the whole batch.
+Reports members per second and database round-trips per member for both paths.
+
+    python -m benchmarks.bulk_registration --members 500 --batch-size 250
+"""
+import argparse
+
+from benchmarks.common import profile_payload, setup_django, test_database, timed
+
+
+def run(members, batch_size, real_hasher):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    from users.models import CustomUser
+
+    client = APIClient()
+    results = {}
+    with test_database(fast_hasher=not real_hasher):
+        with CaptureQueriesContext(connection) as queries, timed() as elapsed:
+            for index in range(members):
+                response = client.post('/profiles/', profile_payload(index), format='json')
+                assert response.status_code == 201, response.content
+        results['single'] = (elapsed['seconds'], len(queries))
+
+        CustomUser.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries, timed() as elapsed:
+            for start in range(0, members, batch_size):
+                payloads = [profile_payload(index) for index in range(start, min(start + batch_size, members))]
+                response = client.post('/profiles/bulk/', payloads, format='json')
+                assert response.status_code == 201, response.content
+        results['bulk'] = (elapsed['seconds'], len(queries))
+
+    print(f'{members} members, bulk batches of {batch_size}, {"PBKDF2" if real_hasher else "MD5"} hasher')
+    for path, (seconds, query_count) in results.items():
+        print(f'  {path:<7} {members / seconds:10.1f} members/s  {query_count / members:6.2f} queries/member')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=250)
+    parser.add_argument('--real-hasher', action='store_true', help='keep the PBKDF2 password hasher')
+    args = parser.parse_args()
+    setup_django()
+    run(args.members, args.batch_size, args.real_hasher)
+
+
+if __name__ == '__main__':
+    main()
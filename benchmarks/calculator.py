@@ -0,0 +1,85 @@
+"""
+Per-item cost of /profiles/calculate/ on one batch of mixed-unit measurements: reading the payloads into columns,
+the vectorized conversion and formulas, the whole request through the test client (JSON parsing and rendering
+included), and for comparison an unsaved Profile per item running normalize_measurements, the only way to get these
+numbers before the endpoint existed.
+
+    python -m benchmarks.calculator --items 10000 --repeats 5
+"""
+import argparse
+import statistics
+
+from benchmarks.common import setup_django, timed
+
+LEVELS = ('Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active', 'Extra Active')
+
+
+def item(index):
+    measurements = {'gender': 'MFO'[index % 3], 'age': 18 + index % 60, 'activity_level': LEVELS[index % len(LEVELS)]}
+    if index % 2:
+        measurements.update({'weight': 120 + index % 150, 'weight_unit': 'lb', 'height_unit': 'ft',
+                             'height_feet': 5 + index % 2, 'height_inches': index % 12})
+    else:
+        measurements.update({'weight': 55 + index % 60, 'height': 150 + index % 45,
+                             'waist_measurement': 80 + index % 30, 'hip_measurement': 60 + index % 20})
+    return measurements
+
+
+def per_item(function, items, repeats):
+    runs = []
+    for _ in range(repeats):
+        with timed() as elapsed:
+            function()
+        runs.append(elapsed['seconds'])
+    return statistics.median(runs) / items * 1e6
+
+
+def run(items, repeats):
+    from django.test.utils import setup_test_environment
+    from rest_framework.test import APIClient
+
+    from users import calculator
+    from users.models import Profile
+
+    payload = [item(index) for index in range(items)]
+    columns, errors = calculator.parse(payload)
+    assert not errors, errors[:3]
+    # no database needed, only the test client's host
+    setup_test_environment()
+    client = APIClient()
+
+    def request():
+        response = client.post('/profiles/calculate/', payload, format='json')
+        assert response.status_code == 200, response.content[:200]
+
+    def profiles():
+        for measurements in payload:
+            profile = Profile(**{
+                field: value for field, value in measurements.items()
+                if field not in ('waist_measurement', 'hip_measurement')
+            })
+            profile.normalize_measurements()
+            profile.calculate_bmr()
+
+    results = {
+        'parse into columns': per_item(lambda: calculator.parse(payload), items, repeats),
+        'convert + calculate': per_item(lambda: calculator.calculate(columns), items, repeats),
+        'whole request': per_item(request, items, repeats),
+        'unsaved Profile per item': per_item(profiles, items, repeats),
+    }
+    print(f'{items} items, median of {repeats} runs')
+    for name, microseconds in results.items():
+        print(f'{name:26} {microseconds:8.2f} us/item')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    setup_django()
+    run(args.items, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
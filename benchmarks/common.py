@@ -0,0 +1,119 @@
+import contextlib
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(settings_module='drf_api.settings'):
+    # settings.py only picks up env.py when run from the repo root
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(fast_hasher=True):
+    """
+    Creates the test database for the default alias and destroys it on exit.
+    fast_hasher swaps PBKDF2 for MD5 so a benchmark measures the database work instead of password hashing.
+    """
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    hashers = settings.PASSWORD_HASHERS
+    if fast_hasher:
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        settings.PASSWORD_HASHERS = hashers
+        teardown_test_environment()
+
+
+@contextlib.contextmanager
+def timed():
+    """Yields a dict whose 'seconds' key is filled in when the block exits."""
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['seconds'] = time.perf_counter() - start
+
+
+def profile_payload(index, **overrides):
+    payload = {
+        'user': {
+            'username': f'bench{index}',
+            'email': f'bench{index}@example.com',
+            'password': 'benchpassword'
+        },
+        'gender': 'M' if index % 2 else 'F',
+        'weight_unit': 'kg',
+        'height_unit': 'cm',
+        'weight': str(55 + index % 40),
+        'height': str(155 + index % 40),
+        'activity_level': 'Moderately Active',
+        'age': 20 + index % 50
+    }
+    payload.update(overrides)
+    return payload
+
+
+def seed_profiles(count, batch_size=5000, progress=True):
+    """
+    Inserts count users and profiles with bulk_create, created_at one second apart so keyset ordering has no ties.
+    Passwords are left unusable, seeding a million rows should not spend its time hashing.
+    """
+    import datetime
+    import io
+
+    from django.core.management import call_command
+    from django.utils import timezone
+    from users.models import CustomUser, Profile
+
+    levels = list(Profile.ACTIVITY_LEVEL_MULTIPLIERS)
+    created_at = Profile._meta.get_field('created_at')
+    start = timezone.now() - datetime.timedelta(seconds=count)
+    # auto_now_add would stamp every row with the insert time
+    created_at.auto_now_add = False
+    try:
+        for offset in range(0, count, batch_size):
+            indexes = range(offset, min(offset + batch_size, count))
+            users = CustomUser.objects.bulk_create(
+                CustomUser(username=f'seed{index}', email=f'seed{index}@example.com', password='!')
+                for index in indexes
+            )
+            profiles = []
+            for index, user in zip(indexes, users):
+                profile = Profile(
+                    user=user,
+                    gender='MFO'[index % 3],
+                    weight=50 + index % 60,
+                    height=150 + index % 45,
+                    activity_level=levels[index % len(levels)],
+                    body_fat=10 + index % 25 if index % 4 else None,
+                    age=18 + index % 60,
+                    created_at=start + datetime.timedelta(seconds=index),
+                )
+                profile.normalize_measurements()
+                profiles.append(profile)
+            Profile.objects.bulk_create(profiles)
+            if progress:
+                print(f'\rseeded {indexes.stop}/{count}', end='', file=sys.stderr)
+    finally:
+        created_at.auto_now_add = True
+    # bulk_create skips Profile.save, so build the population stats the way a live table would have them
+    call_command('rebuild_profile_stats', stdout=io.StringIO())
+    if progress:
+        print(file=sys.stderr)
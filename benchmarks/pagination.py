@@ -0,0 +1,71 @@
+"""
+Page latency for /profiles/ at the start of the table and deep into it, with the old PageNumberPagination
+(COUNT(*) + OFFSET) and the keyset ProfileCursorPagination.
+
+    python -m benchmarks.pagination --rows 1000000
+"""
+import argparse
+import statistics
+
+from benchmarks.common import seed_profiles, setup_django, test_database, timed
+
+
+def page_latency(paginator, queryset, request, repeats):
+    samples = []
+    for _ in range(repeats):
+        with timed() as elapsed:
+            list(paginator.paginate_queryset(queryset, request))
+        samples.append(elapsed['seconds'])
+    return statistics.median(samples) * 1000
+
+
+def run(rows, repeats):
+    from rest_framework.pagination import Cursor, PageNumberPagination
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from users.models import Profile
+    from users.pagination import ProfileCursorPagination
+    from users.serializers import ProfileReadSerializer
+
+    factory = APIRequestFactory()
+    with test_database():
+        seed_profiles(rows)
+        queryset = Profile.objects.values(*ProfileReadSerializer.columns())
+        page_size = ProfileCursorPagination.page_size
+        deep_page = max(rows // page_size - 1, 1)
+
+        numbered = queryset.order_by('-created_at', '-id')
+        results = {
+            'page number, first page': page_latency(
+                PageNumberPagination(), numbered, Request(factory.get('/profiles/')), repeats),
+            'page number, deep page': page_latency(
+                PageNumberPagination(), numbered, Request(factory.get('/profiles/', {'page': deep_page})), repeats),
+        }
+
+        cursor_pagination = ProfileCursorPagination()
+        cursor_pagination.base_url = 'http://testserver/profiles/'
+        deep_row = Profile.objects.order_by('-created_at', '-id').values('created_at')[deep_page * page_size]
+        deep_cursor = cursor_pagination.encode_cursor(
+            Cursor(offset=0, reverse=False, position=str(deep_row['created_at']))
+        ).split('cursor=')[1]
+        results['cursor, first page'] = page_latency(
+            ProfileCursorPagination(), queryset, Request(factory.get('/profiles/')), repeats)
+        results['cursor, deep page'] = page_latency(
+            ProfileCursorPagination(), queryset, Request(factory.get('/profiles/', {'cursor': deep_cursor})), repeats)
+
+    print(f'{rows} profiles, page size {page_size}, median of {repeats} runs')
+    for name, milliseconds in results.items():
+        print(f'  {name:<26} {milliseconds:9.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    run(args.rows, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
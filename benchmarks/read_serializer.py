@@ -0,0 +1,62 @@
+"""
+Rows serialized per second for profile reads: ProfileSerializer over model instances (the old list/retrieve path)
+against ProfileReadSerializer over .values() rows (the current one). Reported for serialization alone and for
+fetch plus serialization, on pages of --page-size rows.
+
+    python -m benchmarks.read_serializer --members 2000 --page-size 100 --repeats 20
+"""
+import argparse
+import statistics
+
+from benchmarks.common import seed_profiles, setup_django, test_database, timed
+
+
+def rate(function, rows, repeats):
+    runs = []
+    for _ in range(repeats):
+        with timed() as elapsed:
+            function()
+        runs.append(elapsed['seconds'])
+    return rows / statistics.median(runs)
+
+
+def run(members, page_size, repeats):
+    from users.models import Profile
+    from users.serializers import ProfileReadSerializer, ProfileSerializer
+
+    with test_database():
+        seed_profiles(members)
+        ordered = Profile.objects.order_by('-created_at', '-id')
+        instances = ordered.select_related('user')[:page_size]
+        rows = ordered.values(*ProfileReadSerializer.columns())[:page_size]
+        loaded_instances = list(instances)
+        loaded_rows = list(rows)
+
+        results = {
+            'ProfileSerializer, serialize only': rate(
+                lambda: ProfileSerializer(loaded_instances, many=True).data, page_size, repeats),
+            'ProfileReadSerializer, serialize only': rate(
+                lambda: ProfileReadSerializer(loaded_rows, many=True).data, page_size, repeats),
+            'ProfileSerializer, fetch + serialize': rate(
+                lambda: ProfileSerializer(list(instances.all()), many=True).data, page_size, repeats),
+            'ProfileReadSerializer, fetch + serialize': rate(
+                lambda: ProfileReadSerializer(list(rows.all()), many=True).data, page_size, repeats),
+        }
+
+    print(f'pages of {page_size} rows, median of {repeats} runs')
+    for name, rows_per_second in results.items():
+        print(f'  {name:<42} {rows_per_second:10.0f} rows/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    run(args.members, args.page_size, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
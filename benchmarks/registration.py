@@ -0,0 +1,69 @@
+"""
+Registrations per second through the sync POST /profiles/ path (one request at a time, like a gunicorn sync worker)
+and through the async POST /profiles/register/ path with --concurrency requests in flight on one event loop.
+Uses the real PBKDF2 hasher, since hashing is what the async path takes off the request thread.
+
+    python -m benchmarks.registration --members 40 --concurrency 8
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import profile_payload, setup_django, test_database, timed
+
+
+async def register_all(client, payloads, concurrency):
+    pending = asyncio.Semaphore(concurrency)
+    busy = 0
+
+    async def register(payload):
+        nonlocal busy
+        async with pending:
+            while True:
+                response = await client.post('/profiles/register/', payload, content_type='application/json')
+                if response.status_code != 503:
+                    break
+                busy += 1
+                await asyncio.sleep(0.01)
+            assert response.status_code == 201, response.content
+
+    await asyncio.gather(*(register(payload) for payload in payloads))
+    return busy
+
+
+def run(members, concurrency):
+    from django.conf import settings
+    from django.test import AsyncClient
+    from rest_framework.test import APIClient
+    from users.models import CustomUser
+
+    with test_database(fast_hasher=False):
+        client = APIClient()
+        with timed() as sync_elapsed:
+            for index in range(members):
+                assert client.post('/profiles/', profile_payload(index), format='json').status_code == 201
+
+        CustomUser.objects.all().delete()
+
+        payloads = [profile_payload(index) for index in range(members)]
+        with timed() as async_elapsed:
+            busy = asyncio.run(register_all(AsyncClient(), payloads, concurrency))
+
+    print(
+        f'{members} registrations, {settings.PASSWORD_HASH_WORKERS} {settings.PASSWORD_HASH_EXECUTOR} hashing '
+        f'workers, {concurrency} in flight on the async path'
+    )
+    print(f'  sync  POST /profiles/          {members / sync_elapsed["seconds"]:8.1f} registrations/s')
+    print(f'  async POST /profiles/register/ {members / async_elapsed["seconds"]:8.1f} registrations/s ({busy} retried 503s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+    setup_django()
+    run(args.members, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
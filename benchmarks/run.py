@@ -0,0 +1,172 @@
+"""
+Latency, throughput and query counts for create, list, retrieve and update on /profiles/, through the full
+middleware and authentication stack (a logged-in session under DEV, the JWT cookie otherwise).
+
+Seeds --profiles rows first, then sends --requests requests per endpoint one at a time. Results are written to
+--output as JSON. With --baseline, every endpoint is compared with the stored run and the script exits 1 when p95
+latency grew by more than --tolerance or the queries per request went up at all. --save-baseline stores this run
+as the new baseline instead.
+
+    python -m benchmarks.run --profiles 10000 --requests 200 --baseline benchmarks/baseline.json
+    python -m benchmarks.run --profiles 1000000 --requests 500 --output million.json
+
+Passwords are hashed with MD5, so create measures the database work rather than PBKDF2.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.common import profile_payload, seed_profiles, setup_django, test_database, timed
+
+ENDPOINTS = ('create', 'list', 'retrieve', 'update')
+
+
+def authenticate(client):
+    """Logs the client in the way the configured DRF authentication class expects."""
+    from django.conf import settings
+    from users.models import CustomUser
+
+    user = CustomUser.objects.create_user('benchrunner', 'benchrunner@example.com', 'benchpassword')
+    classes = settings.REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES']
+    if any(name.endswith('.SessionAuthentication') for name in classes):
+        client.force_login(user)
+    else:
+        from users.authentication import VersionedTokenObtainPairSerializer
+        token = VersionedTokenObtainPairSerializer.get_token(user).access_token
+        client.cookies[settings.JWT_AUTH_COOKIE] = str(token)
+    return user
+
+
+def requests_for(endpoint, count, pks, rng):
+    """Yields (method, path, payload) for each request."""
+    if endpoint == 'create':
+        for index in range(count):
+            yield 'post', '/profiles/', profile_payload(index)
+    elif endpoint == 'list':
+        for _ in range(count):
+            yield 'get', '/profiles/?page_size=20', None
+    elif endpoint == 'retrieve':
+        for _ in range(count):
+            yield 'get', f'/profiles/{rng.choice(pks)}/', None
+    elif endpoint == 'update':
+        levels = ['Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active', 'Extra Active']
+        for _ in range(count):
+            yield 'patch', f'/profiles/{rng.choice(pks)}/', {'activity_level': rng.choice(levels)}
+
+
+def measure(client, endpoint, count, pks, rng):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies = []
+    queries = []
+    next_page = None
+    with timed() as elapsed:
+        for method, path, payload in requests_for(endpoint, count, pks, rng):
+            if endpoint == 'list' and next_page:
+                path = next_page  # walk the cursor instead of reading page one every time
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if payload is None:
+                    response = getattr(client, method)(path)
+                else:
+                    response = getattr(client, method)(path, payload, content_type='application/json')
+                latencies.append(time.perf_counter() - start)
+            assert response.status_code in (200, 201), (endpoint, response.status_code, response.content)
+            queries.append(len(captured))
+            if endpoint == 'list':
+                next_page = response.json()['next']
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        'requests': count,
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+        'throughput_rps': round(count / elapsed['seconds'], 1),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns one message per regression."""
+    regressions = []
+    if baseline.get('profiles') != results['profiles']:
+        print(
+            f'warning: baseline seeded {baseline.get("profiles")} profiles, this run {results["profiles"]}',
+            file=sys.stderr
+        )
+    for endpoint, current in results['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{endpoint}: p95 {previous["p95_ms"]} ms -> {current["p95_ms"]} ms')
+        if current['queries_mean'] > previous['queries_mean']:
+            regressions.append(f'{endpoint}: queries per request {previous["queries_mean"]} -> {current["queries_mean"]}')
+    return regressions
+
+
+def run(profiles, requests, seed):
+    from django.test import Client
+    from users.models import Profile
+
+    rng = random.Random(seed)
+    with test_database():
+        seed_profiles(profiles)
+        pks = list(Profile.objects.values_list('pk', flat=True))
+        client = Client()
+        authenticate(client)
+        endpoints = {endpoint: measure(client, endpoint, requests, pks, rng) for endpoint in ENDPOINTS}
+    return {
+        'profiles': profiles,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'endpoints': endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, default=Path('benchmark-results.json'))
+    parser.add_argument('--baseline', type=Path)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 growth, 0.25 is 25%%')
+    args = parser.parse_args()
+    setup_django()
+
+    results = run(args.profiles, args.requests, args.seed)
+    for endpoint, result in results['endpoints'].items():
+        print(
+            f'{endpoint:9} p50 {result["p50_ms"]:8.2f} ms  p95 {result["p95_ms"]:8.2f} ms  '
+            f'p99 {result["p99_ms"]:8.2f} ms  {result["throughput_rps"]:8.1f} req/s  '
+            f'{result["queries_mean"]:5.2f} queries'
+        )
+    args.output.write_text(json.dumps(results, indent=2) + '\n')
+
+    if args.baseline is None:
+        return
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + '\n')
+        print(f'saved baseline to {args.baseline}')
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressions:
+        print('REGRESSIONS against ' + str(args.baseline), file=sys.stderr)
+        for regression in regressions:
+            print('  ' + regression, file=sys.stderr)
+        sys.exit(1)
+    print(f'no regressions against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
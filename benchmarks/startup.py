@@ -0,0 +1,67 @@
+"""
+Worker cold start for each settings module: the time to import settings, run django.setup() and load the URLconf
+and WSGI handler (what a gunicorn worker does before its first request), the peak resident memory afterwards, and
+how many modules were imported. Each run is a fresh interpreter.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --settings drf_api.settings_api --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import ROOT
+
+SETTINGS = ('drf_api.settings', 'drf_api.settings_api')
+
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+seconds = time.perf_counter() - start
+print(json.dumps({
+    "seconds": seconds,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "loaded": sorted(name for name in sys.modules if "." not in name),
+}))
+'''
+
+
+def measure(settings_module):
+    """One cold start in a new interpreter, returns the probe's numbers."""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    # settings.py only picks up env.py when run from the repo root
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(settings_modules, runs):
+    for settings_module in settings_modules:
+        results = [measure(settings_module) for _ in range(runs)]
+        seconds = statistics.median(result['seconds'] for result in results) * 1000
+        rss = statistics.median(result['rss_kb'] for result in results) / 1024
+        print(
+            f'{settings_module:24} setup {seconds:8.1f} ms  peak RSS {rss:7.1f} MiB  '
+            f'{results[0]["modules"]:5} modules'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', nargs='+', default=list(SETTINGS))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    run(args.settings, args.runs)
+
+
+if __name__ == '__main__':
+    main()
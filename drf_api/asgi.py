@@ -2,6 +2,8 @@
 ASGI config for drf_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (for example ``uvicorn drf_api.asgi:application``) to get the async views in
+users/async_views.py running on the event loop instead of one request per thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
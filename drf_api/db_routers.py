@@ -0,0 +1,102 @@
+"""
+Read replicas. The database aliases in DATABASE_REPLICAS (see settings.py) are read replicas of "default". Reads go
+to the primary unless ReplicaRoutingMiddleware has switched the current request over, which it does for safe requests
+to the view actions listed in the view's replica_actions (ProfileViewSet list and retrieve).
+
+After a write (a successful request that asked the router for a database to write to) the client gets a cookie that
+keeps its requests on the primary for DATABASE_REPLICA_STICKY_SECONDS, so it reads its own writes even while the
+replicas lag behind. Requests that only read, like POST /profiles/calculate/, don't get it. The cookie is sent
+cross-site like the JWT one (JWT_AUTH_SAMESITE, JWT_AUTH_SECURE).
+
+The middleware works in sync and async mode, so under ASGI it doesn't push requests onto a thread.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+use_replica = contextvars.ContextVar('use_replica', default=False)
+# {'wrote': bool} for the current request, set by db_for_write (also from sync_to_async threads, which share it)
+request_writes = contextvars.ContextVar('request_writes', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects are read from wherever the instance came from
+            return instance._state.db
+        if use_replica.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        writes = {'wrote': False}
+        tokens = use_replica.set(False), request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.reset(tokens)
+        return self.finish(request, response, writes)
+
+    async def __acall__(self, request):
+        writes = {'wrote': False}
+        tokens = use_replica.set(False), request_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.reset(tokens)
+        return self.finish(request, response, writes)
+
+    def reset(self, tokens):
+        use_replica.reset(tokens[0])
+        request_writes.reset(tokens[1])
+
+    def finish(self, request, response, writes):
+        if writes['wrote'] and response.status_code < 400:
+            response.set_cookie(
+                settings.DATABASE_STICKY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                # same attributes as the JWT cookie, or the cross-site frontend's fetches would go without it
+                httponly=True, samesite=settings.JWT_AUTH_SAMESITE, secure=settings.JWT_AUTH_SECURE,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in SAFE_METHODS or settings.DATABASE_STICKY_COOKIE in request.COOKIES:
+            return None
+        view_class = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get('get' if request.method == 'HEAD' else request.method.lower())
+        if action is not None and action in getattr(view_class, 'replica_actions', ()):
+            use_replica.set(True)
+        return None
@@ -0,0 +1,260 @@
+"""
+Per-request timings. RequestTimingMiddleware measures where each request spends its time, sends the numbers back in a
+Server-Timing header and folds them into histograms that GET /metrics exposes in the Prometheus text format, labeled
+by route (the URL name) and method.
+
+Phases:
+    db          every query, through a connection execute_wrapper
+    auth        DRF authentication (session or JWT cookie), see TimedAuthenticationMixin
+    serializer  is_valid() and .data, see TimedSerializerMixin
+    hash        password hashing, wrapped where the serializers call set_password
+    view        from process_view until the view returns
+    render      turning a DRF Response into bytes
+    total       the whole request, from this middleware in to this middleware out
+
+Phases overlap (db and serializer time are part of view time). Histograms are kept per process, so with several
+workers Prometheus should scrape each one or the numbers should be summed.
+
+Every connection gets count_queries as an execute_wrapper when it connects. It adds to the Timings in the current
+context, which sync_to_async carries into its threads, so the queries of the async views are counted too. The
+middleware works in both sync and async mode, under ASGI it doesn't push the request onto a thread.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+PHASES = ('db', 'auth', 'serializer', 'hash', 'view', 'render')
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+current = contextvars.ContextVar('request_timings', default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.seconds = {}
+        self.queries = 0
+        self.active = set()
+        self.view_started = None
+        self.view_finished = None
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0) + seconds
+
+    def query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('db', time.perf_counter() - start)
+
+
+def count_queries(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.query(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install)
+
+
+@contextlib.contextmanager
+def timer(phase):
+    """Adds the time spent in the block to phase. A no-op outside a request, and when phase is already being timed."""
+    timings = current.get()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(phase)
+        timings.add(phase, time.perf_counter() - start)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self.rows = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            row = self.rows.get(labels)
+            if row is None:
+                # one count per bucket plus +Inf, then the sum
+                row = self.rows[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            rows = {labels: list(row) for labels, row in self.rows.items()}
+        for labels, row in sorted(rows.items()):
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {row[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.rows.clear()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent on the whole request.', LATENCY_BUCKETS, ('route', 'method')
+)
+PHASE_SECONDS = Histogram(
+    'http_request_phase_duration_seconds', 'Time spent in each phase of a request.', LATENCY_BUCKETS,
+    ('route', 'method', 'phase')
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries run per request.', QUERY_BUCKETS, ('route', 'method')
+)
+HISTOGRAMS = (REQUEST_SECONDS, PHASE_SECONDS, REQUEST_QUERIES)
+
+
+class RequestTimingMiddleware:
+    """Goes first in MIDDLEWARE so total covers every other middleware."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # connections that were open before this module was imported
+        for connection in connections.all():
+            install(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings = Timings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def finish(self, request, response, timings, start):
+        finished = time.perf_counter()
+        if timings.view_started is not None:
+            timings.add('view', (timings.view_finished or finished) - timings.view_started)
+        total = finished - start
+        self.record(request, timings, total)
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = self.server_timing(timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current.get().view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the template response middleware, so time render() itself
+        timings = current.get()
+        timings.view_finished = time.perf_counter()
+        render = response.render
+
+        def timed_render():
+            with timer('render'):
+                return render()
+
+        response.render = timed_render
+        return response
+
+    def record(self, request, timings, total):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'other'
+        REQUEST_SECONDS.observe((route, method), total)
+        REQUEST_QUERIES.observe((route, method), timings.queries)
+        for phase, seconds in timings.seconds.items():
+            PHASE_SECONDS.observe((route, method, phase), seconds)
+
+    def server_timing(self, timings, total):
+        entries = []
+        for phase in PHASES:
+            if phase in timings.seconds:
+                entry = f'{phase};dur={timings.seconds[phase] * 1000:.2f}'
+                if phase == 'db':
+                    entry += f';desc="{timings.queries} queries"'
+                entries.append(entry)
+        entries.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(entries)
+
+
+class TimedAuthenticationMixin:
+    """For DRF views, times authentication as the auth phase."""
+
+    def perform_authentication(self, request):
+        with timer('auth'):
+            super().perform_authentication(request)
+
+
+class TimedSerializerMixin:
+    """For DRF serializers, times validation and building the representation as the serializer phase."""
+
+    def is_valid(self, *args, **kwargs):
+        with timer('serializer'):
+            return super().is_valid(*args, **kwargs)
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
+
+
+def metrics(request):
+    """GET /metrics. With METRICS_TOKEN set, the scraper has to send it as a bearer token."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.expose()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
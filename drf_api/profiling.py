@@ -0,0 +1,118 @@
+"""
+On-demand cProfile for single requests. RequestProfilingMiddleware profiles a request when it carries a valid
+X-Profile-Request token (see `manage.py request_profiles token`) or when it is picked by
+REQUEST_PROFILING_SAMPLE_RATE, and saves the stats to REQUEST_PROFILING_DIR as
+<UTC timestamp>-<method>-<route>.prof. The directory is a ring: once it holds more than REQUEST_PROFILING_MAX_FILES
+files or REQUEST_PROFILING_MAX_BYTES bytes, the oldest profiles are removed.
+
+Everything after this middleware runs under the profiler, so authentication (allauth, dj_rest_auth, simplejwt) shows
+up next to the view and serializer code. `manage.py request_profiles list|show` reads the files back.
+
+Only sync requests are profiled. cProfile follows one thread, and an async request shares the event loop with every
+other request in flight, so under ASGI the middleware passes requests straight through instead of making them wait on
+a thread.
+"""
+import cProfile
+import datetime
+import os
+import random
+import re
+import tempfile
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+
+HEADER = 'X-Profile-Request'
+SALT = 'drf_api.profiling'
+
+
+def issue_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.REQUEST_PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def profile_dir():
+    return Path(settings.REQUEST_PROFILING_DIR)
+
+
+def stored_profiles():
+    """The saved profiles, oldest first (file names start with the timestamp)."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob('*.prof'))
+
+
+def trim():
+    profiles = stored_profiles()
+    sizes = [path.stat().st_size for path in profiles]
+    total = sum(sizes)
+    limit_files = settings.REQUEST_PROFILING_MAX_FILES
+    limit_bytes = settings.REQUEST_PROFILING_MAX_BYTES
+    while profiles and (len(profiles) > limit_files or total > limit_bytes):
+        path = profiles.pop(0)
+        total -= sizes.pop(0)
+        path.unlink(missing_ok=True)
+
+
+def save(profiler, request):
+    match = request.resolver_match
+    route = (match.view_name or match.route) if match else 'unmatched'
+    route = re.sub(r'[^A-Za-z0-9_.-]+', '_', route).strip('_')[:80] or 'root'
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{stamp}-{request.method.lower()}-{route}.prof'
+    # written under a temporary name so `request_profiles` never reads half a file
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(descriptor)
+    profiler.dump_stats(temporary)
+    os.replace(temporary, path)
+    trim()
+    return path
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+        if not self.wanted(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already running on this thread
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        response['X-Profile-File'] = save(profiler, request).name
+        return response
+
+    def wanted(self, request):
+        token = request.headers.get(HEADER)
+        if token is not None:
+            return valid_token(token)
+        rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
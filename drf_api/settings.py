@@ -31,7 +31,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [(
         'rest_framework.authentication.SessionAuthentication'
         if 'DEV' in os.environ
-        else 'dj_rest_auth.jwt_auth.JWTCookieAuthentication'
+        else 'users.authentication.StatelessJWTCookieAuthentication'
     )],
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.PageNumberPagination',
@@ -43,6 +43,34 @@ if 'DEV' not in os.environ:
         'rest_framework.renderers.JSONRenderer',
     ]
 
+# Derived profile metrics (users/metrics.py) use the default cache, LocMemCache per process unless CACHES is set
+PROFILE_METRICS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Delta sync (users/sync.py). Watermarks older than this stop working, so tombstones older than it can be pruned with
+# manage.py prune_profile_tombstones
+PROFILE_SYNC_WATERMARK_MAX_AGE = 60 * 60 * 24 * 90
+# seconds a change waits before sync hands it out, longer than any transaction that writes profiles or tombstones
+PROFILE_SYNC_SAFETY_LAG = 30
+
+# Password hashing pool for the async registration view (users/hashing.py). 'thread' or 'process'.
+PASSWORD_HASH_EXECUTOR = 'thread'
+PASSWORD_HASH_WORKERS = 4
+# hashes allowed to wait for a free worker before registration answers 503
+PASSWORD_HASH_MAX_QUEUE = 16
+
+# Request timings (drf_api/instrumentation.py). The Server-Timing header shows clients where the time went, and
+# GET /metrics needs METRICS_TOKEN as a bearer token when it is set
+SERVER_TIMING_HEADER = True
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# cProfile for single requests (drf_api/profiling.py), on a signed X-Profile-Request header or a sampled share of
+# requests. The newest profiles are kept within both limits.
+REQUEST_PROFILING_DIR = os.environ.get('REQUEST_PROFILING_DIR', BASE_DIR / 'request-profiles')
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0))
+REQUEST_PROFILING_TOKEN_MAX_AGE = 60 * 60
+REQUEST_PROFILING_MAX_FILES = 200
+REQUEST_PROFILING_MAX_BYTES = 100 * 1024 * 1024
+
 REST_USE_JWT = True
 JWT_AUTH_SECURE = True
 JWT_AUTH_COOKIE = 'my-app-auth'
@@ -51,8 +79,11 @@ JWT_AUTH_SAMESITE = 'None'
 
 
 REST_AUTH_SERIALIZERS = {
-    'USER_DETAILS_SERIALIZER': 'drf_api.serializers.CurrentUserSerializer'
+    'USER_DETAILS_SERIALIZER': 'drf_api.serializers.CurrentUserSerializer',
+    'JWT_TOKEN_CLAIMS_SERIALIZER': 'users.authentication.VersionedTokenObtainPairSerializer',
 }
+# how long a user's token_version is trusted from the cache (users/authentication.py)
+JWT_TOKEN_VERSION_CACHE_TIMEOUT = 30
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
@@ -99,11 +130,15 @@ INSTALLED_APPS = [
     'dj_rest_auth.registration',
     'corsheaders',
     'users',
+    'progress',
 ]
 
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'drf_api.instrumentation.RequestTimingMiddleware',
+    'drf_api.profiling.RequestProfilingMiddleware',
+    'drf_api.db_routers.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -208,6 +243,28 @@ else:
          'default': dj_database_url.parse(os.environ.get("DATABASE_URL"))
      }
 
+# Read replicas (drf_api/db_routers.py) from comma-separated URLs. Under DEV a second SQLite file can stand in for
+# one with DEV_DATABASE_REPLICA=1, copy db.sqlite3 to db-replica.sqlite3 to get a replica that lags behind.
+# In tests every replica alias mirrors the test database.
+replica_urls = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+for index, url in enumerate(replica_urls, 1):
+    DATABASES[f'replica{index}'] = dj_database_url.parse(url)
+if 'DEV' in os.environ and not replica_urls:
+    DATABASES['replica1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db-replica.sqlite3'}
+for alias in DATABASES:
+    if alias != 'default':
+        DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+# the aliases reads are spread over
+DATABASE_REPLICAS = (
+    [f'replica{index}' for index in range(1, len(replica_urls) + 1)]
+    or (['replica1'] if 'DEV_DATABASE_REPLICA' in os.environ else [])
+)
+
+DATABASE_ROUTERS = ['drf_api.db_routers.ReplicaRouter']
+# after a write, the client's reads stay on the primary this long
+DATABASE_REPLICA_STICKY_SECONDS = 5
+DATABASE_STICKY_COOKIE = 'use_primary'
+
 
 
 # Password validation
@@ -0,0 +1,43 @@
+"""
+Lean settings for API-only workers, e.g. DJANGO_SETTINGS_MODULE=drf_api.settings_api gunicorn drf_api.wsgi
+
+Everything comes from drf_api/settings.py except the apps, middleware and URLs the /profiles/ and /progress/ stack
+doesn't use: the admin, messages, static files, templates, cloudinary, allauth and its social providers, and the
+dj_rest_auth registration and login views. Sign-up, social login and the admin stay on workers running the full
+settings. benchmarks/startup.py compares the two.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE, REST_FRAMEWORK
+
+# progress stays, deleting a profile has to cascade to its measurements
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'rest_framework',
+    'corsheaders',
+    'users',
+    'progress',
+]
+
+MIDDLEWARE = [
+    middleware for middleware in MIDDLEWARE
+    if middleware not in (
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    )
+]
+
+ROOT_URLCONF = 'drf_api.urls_api'
+
+# no browsable API, so no templates to load
+TEMPLATES = []
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
+# media uploads go through the full settings
+del DEFAULT_FILE_STORAGE, CLOUDINARY_STORAGE  # noqa: F821
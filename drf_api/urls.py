@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls.conf import include
+from drf_api import instrumentation
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('allauth.urls')),
     path('profiles/', include('users.urls')),
+    path('progress/', include('progress.urls')),
+    path('metrics', instrumentation.metrics, name='metrics'),
 ]
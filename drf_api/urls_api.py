@@ -0,0 +1,10 @@
+"""URLs for API-only workers (drf_api/settings_api.py), drf_api/urls.py without the admin and allauth."""
+from django.urls import path
+from django.urls.conf import include
+from drf_api import instrumentation
+
+urlpatterns = [
+    path('profiles/', include('users.urls')),
+    path('progress/', include('progress.urls')),
+    path('metrics', instrumentation.metrics, name='metrics'),
+]
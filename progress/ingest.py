@@ -0,0 +1,40 @@
+from django.db import transaction
+
+from users.models import Profile
+from . import rollups
+from .models import Measurement
+
+
+def ingest(profile_id, readings, batch_size=1000):
+    """
+    Appends validated readings (dicts with recorded_at and weight/body_fat) for one profile.
+    Readings repeated within the batch keep the last copy; readings already stored are skipped. Those are found with
+    one range read over the batch's time span on the (profile, recorded_at) index, and ignore_conflicts covers a
+    concurrent upload of the same readings. The new readings are folded into the daily and weekly rollups in the same
+    transaction. Returns the Measurements that were new.
+    """
+    by_time = {reading['recorded_at']: reading for reading in readings}
+    if not by_time:
+        return []
+
+    with transaction.atomic():
+        # one ingest per member at a time, otherwise two uploads of the same readings could both count them in the rollups
+        Profile.objects.select_for_update().filter(pk=profile_id).exists()
+        stored = set(
+            Measurement.objects
+            .filter(profile_id=profile_id, recorded_at__range=(min(by_time), max(by_time)))
+            .values_list('recorded_at', flat=True)
+        )
+        new = [
+            Measurement(
+                profile_id=profile_id,
+                recorded_at=recorded_at,
+                weight=reading.get('weight'),
+                body_fat=reading.get('body_fat'),
+            )
+            for recorded_at, reading in sorted(by_time.items())
+            if recorded_at not in stored
+        ]
+        Measurement.objects.bulk_create(new, batch_size=batch_size, ignore_conflicts=True)
+        rollups.apply(new)
+    return new
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0006_profile_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Measurement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('weight', models.FloatField(blank=True, null=True)),
+                ('body_fat', models.FloatField(blank=True, null=True)),
+                ('profile', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='measurements', to='users.profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='measurement',
+            constraint=models.UniqueConstraint(fields=('profile', 'recorded_at'), name='measurement_profile_recorded_at'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_profile_created_id_idx'),
+        ('progress', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('day', 'Daily'), ('week', 'Weekly')], max_length=4)),
+                ('period_start', models.DateField()),
+                ('weight_count', models.IntegerField(default=0)),
+                ('weight_sum', models.FloatField(default=0)),
+                ('weight_min', models.FloatField(blank=True, null=True)),
+                ('weight_max', models.FloatField(blank=True, null=True)),
+                ('weight_last', models.FloatField(blank=True, null=True)),
+                ('weight_last_at', models.DateTimeField(blank=True, null=True)),
+                ('body_fat_count', models.IntegerField(default=0)),
+                ('body_fat_sum', models.FloatField(default=0)),
+                ('body_fat_min', models.FloatField(blank=True, null=True)),
+                ('body_fat_max', models.FloatField(blank=True, null=True)),
+                ('body_fat_last', models.FloatField(blank=True, null=True)),
+                ('body_fat_last_at', models.DateTimeField(blank=True, null=True)),
+                ('profile', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='users.profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='measurementrollup',
+            constraint=models.UniqueConstraint(fields=('profile', 'resolution', 'period_start'), name='rollup_profile_resolution_period'),
+        ),
+    ]
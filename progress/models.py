@@ -0,0 +1,63 @@
+from django.db import models
+
+from users.models import Profile
+
+
+class Measurement(models.Model):
+    """
+    One reading of a member's weight and/or body fat, mostly pushed by wearables every few minutes. Rows are only ever
+    appended. (profile, recorded_at) is the natural key: it is unique, so a re-sent reading is dropped, and its index is
+    what every read goes through, always bounded to a time window.
+    """
+    # the unique (profile, recorded_at) index already starts with profile, a second index on it would be dead weight
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='measurements', db_index=False)
+    recorded_at = models.DateTimeField()
+    weight = models.FloatField(null=True, blank=True) # kg
+    body_fat = models.FloatField(null=True, blank=True) # percent
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'recorded_at'], name='measurement_profile_recorded_at'),
+        ]
+
+    def __str__(self):
+        return f'{self.profile_id} @ {self.recorded_at.isoformat()}'
+
+
+class MeasurementRollup(models.Model):
+    """
+    Daily and weekly summaries of a member's measurements, kept up to date as readings are ingested (see
+    progress/rollups.py) so long-range charts read a few hundred rows instead of every reading.
+    Averages are stored as a sum and a count so new readings can be folded in without rereading old ones.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    RESOLUTIONS = [
+        (DAY, 'Daily'),
+        (WEEK, 'Weekly'),
+    ]
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='rollups', db_index=False)
+    resolution = models.CharField(max_length=4, choices=RESOLUTIONS)
+    period_start = models.DateField() # UTC day, or the Monday of the week
+    weight_count = models.IntegerField(default=0)
+    weight_sum = models.FloatField(default=0)
+    weight_min = models.FloatField(null=True, blank=True)
+    weight_max = models.FloatField(null=True, blank=True)
+    weight_last = models.FloatField(null=True, blank=True)
+    weight_last_at = models.DateTimeField(null=True, blank=True)
+    body_fat_count = models.IntegerField(default=0)
+    body_fat_sum = models.FloatField(default=0)
+    body_fat_min = models.FloatField(null=True, blank=True)
+    body_fat_max = models.FloatField(null=True, blank=True)
+    body_fat_last = models.FloatField(null=True, blank=True)
+    body_fat_last_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['profile', 'resolution', 'period_start'], name='rollup_profile_resolution_period'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.profile_id} {self.resolution} {self.period_start.isoformat()}'
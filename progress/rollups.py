@@ -0,0 +1,75 @@
+"""
+Incremental maintenance of MeasurementRollup. New readings are grouped by (profile, resolution, period) in Python,
+the matching rollup rows are read once, and the new readings are folded into them, so the cost of an ingest grows
+with the size of the batch and never with the length of the member's history.
+"""
+import datetime
+
+from .models import MeasurementRollup
+
+METRICS = ('weight', 'body_fat')
+RESOLUTIONS = (MeasurementRollup.DAY, MeasurementRollup.WEEK)
+
+
+def period_start(recorded_at, resolution):
+    day = recorded_at.astimezone(datetime.timezone.utc).date()
+    if resolution == MeasurementRollup.WEEK:
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def fold(rollup, metric, value, recorded_at):
+    count = getattr(rollup, f'{metric}_count')
+    low = getattr(rollup, f'{metric}_min')
+    high = getattr(rollup, f'{metric}_max')
+    last_at = getattr(rollup, f'{metric}_last_at')
+    setattr(rollup, f'{metric}_count', count + 1)
+    setattr(rollup, f'{metric}_sum', getattr(rollup, f'{metric}_sum') + value)
+    setattr(rollup, f'{metric}_min', value if low is None else min(low, value))
+    setattr(rollup, f'{metric}_max', value if high is None else max(high, value))
+    if last_at is None or recorded_at >= last_at:
+        setattr(rollup, f'{metric}_last', value)
+        setattr(rollup, f'{metric}_last_at', recorded_at)
+
+
+def apply(measurements):
+    """
+    Folds newly stored measurements into their daily and weekly rollups. Call it inside the transaction that stored
+    them, and only with readings that were really new, or they are counted twice.
+    """
+    keys = {}
+    for measurement in measurements:
+        for resolution in RESOLUTIONS:
+            key = (measurement.profile_id, resolution, period_start(measurement.recorded_at, resolution))
+            keys.setdefault(key, []).append(measurement)
+    if not keys:
+        return
+
+    profile_ids = {key[0] for key in keys}
+    periods = {key[2] for key in keys}
+    existing = {
+        (rollup.profile_id, rollup.resolution, rollup.period_start): rollup
+        for rollup in MeasurementRollup.objects.filter(profile_id__in=profile_ids, period_start__in=periods)
+    }
+
+    created = []
+    updated = []
+    for key, readings in keys.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            profile_id, resolution, start = key
+            rollup = MeasurementRollup(profile_id=profile_id, resolution=resolution, period_start=start)
+            created.append(rollup)
+        else:
+            updated.append(rollup)
+        for measurement in readings:
+            for metric in METRICS:
+                value = getattr(measurement, metric)
+                if value is not None:
+                    fold(rollup, metric, value, measurement.recorded_at)
+
+    MeasurementRollup.objects.bulk_create(created)
+    MeasurementRollup.objects.bulk_update(
+        updated,
+        [f'{metric}_{part}' for metric in METRICS for part in ('count', 'sum', 'min', 'max', 'last', 'last_at')],
+    )
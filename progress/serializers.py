@@ -0,0 +1,23 @@
+from rest_framework import serializers
+
+
+class MeasurementSerializer(serializers.Serializer):
+    """
+    A plain Serializer rather than a ModelSerializer: a batch holds thousands of readings, and uniqueness is handled
+    for the whole batch at once in the view instead of one validator query per reading.
+    """
+    recorded_at = serializers.DateTimeField(format='iso-8601')
+    weight = serializers.FloatField(required=False, allow_null=True, min_value=0)
+    body_fat = serializers.FloatField(required=False, allow_null=True, min_value=0, max_value=100)
+
+    def validate(self, data):
+        if data.get('weight') is None and data.get('body_fat') is None:
+            raise serializers.ValidationError('A measurement needs a weight, a body fat, or both.')
+        return data
+
+
+class HistoryQuerySerializer(serializers.Serializer):
+    metric = serializers.ChoiceField(choices=['weight', 'body_fat', 'tdee'], default='weight')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    max_points = serializers.IntegerField(default=200, min_value=2, max_value=2000)
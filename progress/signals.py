@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import rollups
+from .models import Measurement
+
+
+@receiver(post_save, sender=Measurement)
+def roll_up_measurement(sender, instance, created, raw=False, **kwargs):
+    # bulk ingestion sends no signals and rolls up its own batch, this covers readings saved one at a time
+    if created and not raw:
+        rollups.apply([instance])
@@ -0,0 +1,154 @@
+import datetime
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.models import CustomUser, Profile
+from .models import Measurement, MeasurementRollup
+
+
+class MeasurementTestCase(TestCase):
+    """
+    readings come in as big batches, repeats are dropped on (profile, recorded_at), and reads only ever cover a time window through that index."""
+    def setUp(self):
+        self.client = APIClient()
+        user = CustomUser.objects.create(username='member', email='member@example.com')
+        self.profile = Profile.objects.create(
+            user=user, gender='F', weight=60, height=165, activity_level='Sedentary', age=30
+        )
+        self.url = f'/progress/{self.profile.pk}/measurements/'
+        self.start = timezone.now().replace(microsecond=0) - datetime.timedelta(days=1)
+
+    def readings(self, count, offset=0):
+        return [
+            {
+                'recorded_at': (self.start + datetime.timedelta(minutes=5 * (offset + index))).isoformat(),
+                'weight': 60 + index / 100,
+            }
+            for index in range(count)
+        ]
+
+    def test_batch_ingest_deduplicates(self):
+        response = self.client.post(self.url, self.readings(2000), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'received': 2000, 'created': 2000})
+
+        # half of these were already stored, and one is sent twice
+        batch = self.readings(200, offset=1900)
+        batch.append(dict(batch[-1]))
+        response = self.client.post(self.url, batch, format='json')
+        self.assertEqual(response.data, {'received': 201, 'created': 100})
+        self.assertEqual(Measurement.objects.count(), 2100)
+
+    def test_invalid_readings_reject_the_batch(self):
+        batch = self.readings(3)
+        batch[1] = {'recorded_at': batch[1]['recorded_at']}
+        response = self.client.post(self.url, batch, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('non_field_errors', response.data[1])
+        self.assertEqual(Measurement.objects.count(), 0)
+
+    def test_unknown_profile(self):
+        response = self.client.post(f'/progress/{self.profile.pk + 1}/measurements/', self.readings(1), format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_range_read_pages_through_window(self):
+        self.client.post(self.url, self.readings(30), format='json')
+        end = self.start + datetime.timedelta(minutes=5 * 25)
+        response = self.client.get(self.url, {'start': self.start.isoformat(), 'end': end.isoformat(), 'limit': 20})
+        self.assertEqual(len(response.data['results']), 20)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNone(response.data['next'])
+
+    def test_window_is_bounded(self):
+        response = self.client.get(self.url, {'start': (self.start - datetime.timedelta(days=400)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'checks the SQLite query plan')
+    def test_range_read_uses_natural_key_index(self):
+        plan = Measurement.objects.filter(
+            profile_id=self.profile.pk, recorded_at__gte=self.start, recorded_at__lt=timezone.now()
+        ).order_by('recorded_at').explain()
+        # SQLite builds the unique constraint as an automatic index, so check the search rather than the index name
+        self.assertRegex(plan, r'SEARCH progress_measurement USING INDEX \S+ \(profile_id=\? AND recorded_at>\? AND recorded_at<\?\)')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class RollupTestCase(TestCase):
+    """
+    daily and weekly rollups follow every ingest, and the history endpoint reads the coarsest table it needs."""
+    def setUp(self):
+        self.client = APIClient()
+        user = CustomUser.objects.create(username='member', email='member@example.com')
+        self.profile = Profile.objects.create(
+            user=user, gender='M', weight=80, height=180, activity_level='Moderately Active', age=40
+        )
+        self.url = f'/progress/{self.profile.pk}/measurements/'
+        # a Monday, so the first 7 days are one week
+        self.monday = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def post_days(self, days, per_day=4, first_day=0):
+        readings = []
+        for day in range(first_day, first_day + days):
+            for index in range(per_day):
+                readings.append({
+                    'recorded_at': (self.monday + datetime.timedelta(days=day, hours=index * 6)).isoformat(),
+                    'weight': 80 + day + index,
+                })
+        self.client.post(self.url, readings, format='json')
+
+    def test_rollups_follow_ingest(self):
+        self.post_days(3)
+        self.post_days(5, first_day=2)  # day 2 is sent again and has to be counted once
+        day = MeasurementRollup.objects.get(resolution='day', period_start=datetime.date(2024, 1, 3))
+        self.assertEqual((day.weight_count, day.weight_min, day.weight_max, day.weight_last), (4, 82, 85, 85))
+        week = MeasurementRollup.objects.get(resolution='week')
+        self.assertEqual(week.weight_count, 28)
+        self.assertEqual(week.weight_sum / week.weight_count, sum(80 + d + i for d in range(7) for i in range(4)) / 28)
+
+    def test_single_save_is_rolled_up(self):
+        Measurement.objects.create(profile=self.profile, recorded_at=self.monday, body_fat=18.0)
+        day = MeasurementRollup.objects.get(resolution='day')
+        self.assertEqual((day.body_fat_count, day.body_fat_last, day.weight_count), (1, 18.0, 0))
+
+    def test_history_picks_resolution(self):
+        self.post_days(70)
+        history = f'/progress/{self.profile.pk}/history/'
+        end = self.monday + datetime.timedelta(days=70)
+
+        response = self.client.get(history, {'start': self.monday.isoformat(), 'end': (self.monday + datetime.timedelta(days=2)).isoformat()})
+        self.assertEqual(response.data['resolution'], 'raw')
+        self.assertEqual(len(response.data['points']), 8)
+
+        response = self.client.get(history, {'start': self.monday.isoformat(), 'end': end.isoformat(), 'max_points': 100})
+        self.assertEqual(response.data['resolution'], 'day')
+        self.assertEqual(len(response.data['points']), 70)
+
+        with self.assertNumQueries(3):  # raw probe, profile, weekly rollups
+            response = self.client.get(history, {'start': self.monday.isoformat(), 'end': end.isoformat(), 'max_points': 20})
+        self.assertEqual(response.data['resolution'], 'week')
+        self.assertEqual([point['count'] for point in response.data['points']], [28] * 10)
+
+        # 11 weeks in 4 points: three weeks per point
+        response = self.client.get(history, {'start': self.monday.isoformat(), 'end': end.isoformat(), 'max_points': 4})
+        self.assertEqual(response.data['resolution'], '3-week')
+        points = response.data['points']
+        self.assertEqual([point['count'] for point in points], [84, 84, 84, 28])
+        self.assertEqual(points[1]['time'], (self.monday + datetime.timedelta(weeks=3)).date())
+        self.assertEqual((points[0]['min'], points[0]['max'], points[0]['last']), (80, 20 + 83, 20 + 83))
+        self.assertEqual(points[0]['avg'], sum(80 + d + i for d in range(21) for i in range(4)) / 84)
+
+    def test_tdee_history(self):
+        self.post_days(1)
+        response = self.client.get(
+            f'/progress/{self.profile.pk}/history/',
+            {'metric': 'tdee', 'start': self.monday.isoformat(), 'end': (self.monday + datetime.timedelta(days=1)).isoformat(), 'max_points': 2}
+        )
+        self.assertEqual(response.data['resolution'], 'day')
+        self.profile.weight = 83
+        self.assertEqual(response.data['points'][0]['max'], self.profile.calculate_tdee())
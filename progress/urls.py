@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import HistoryView, MeasurementView
+
+urlpatterns = [
+    path('<int:profile_id>/measurements/', MeasurementView.as_view(), name='measurements'),
+    path('<int:profile_id>/history/', HistoryView.as_view(), name='history'),
+]
@@ -0,0 +1,190 @@
+import datetime
+import math
+
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.models import Profile
+from .ingest import ingest
+from .rollups import period_start
+from .models import Measurement, MeasurementRollup
+from .serializers import HistoryQuerySerializer, MeasurementSerializer
+
+
+class MeasurementView(APIView):
+    """
+    GET  /progress/{profile_id}/measurements/?start=&end=&limit= reads one time window, oldest first.
+    POST /progress/{profile_id}/measurements/ appends a list of readings.
+    """
+    max_batch = 10000
+    default_window = datetime.timedelta(days=30)
+    max_window = datetime.timedelta(days=366)
+    default_limit = 1000
+    max_limit = 10000
+
+    def get(self, request, profile_id):
+        start, end, limit = self.get_window(request)
+        rows = list(
+            Measurement.objects
+            .filter(profile_id=profile_id, recorded_at__gte=start, recorded_at__lt=end)
+            .order_by('recorded_at')
+            .values('recorded_at', 'weight', 'body_fat')[:limit + 1]
+        )
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            # recorded_at is unique per profile, so the next page starts just after the last reading
+            next_start = rows[-1]['recorded_at'] + datetime.timedelta(microseconds=1)
+            query = request.query_params.copy()
+            query['start'] = next_start.isoformat()
+            query['end'] = end.isoformat()
+            next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        return Response({
+            'start': start,
+            'end': end,
+            'next': next_url,
+            'results': MeasurementSerializer(rows, many=True).data,
+        })
+
+    def post(self, request, profile_id):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of measurements.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_batch:
+            return Response(
+                {'detail': f'A batch can hold at most {self.max_batch} measurements.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not Profile.objects.filter(pk=profile_id).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = MeasurementSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        created = ingest(profile_id, serializer.validated_data)
+        return Response(
+            {'received': len(serializer.validated_data), 'created': len(created)},
+            status=status.HTTP_201_CREATED
+        )
+
+    def get_window(self, request):
+        field = serializers.DateTimeField()
+        try:
+            end = field.to_internal_value(request.query_params['end']) if 'end' in request.query_params else timezone.now()
+            start = (
+                field.to_internal_value(request.query_params['start'])
+                if 'start' in request.query_params else end - self.default_window
+            )
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            raise serializers.ValidationError({'limit': 'Must be a whole number.'})
+        if start >= end:
+            raise serializers.ValidationError({'start': 'Must be before end.'})
+        if end - start > self.max_window:
+            raise serializers.ValidationError({'start': f'The window can be at most {self.max_window.days} days.'})
+        if limit < 1:
+            raise serializers.ValidationError({'limit': 'Must be at least 1.'})
+        return start, end, limit
+
+
+class HistoryView(APIView):
+    """
+    GET /progress/{profile_id}/history/?metric=weight&start=&end=&max_points=200 returns chart points for a window.
+    The finest resolution that fits in max_points is used: the raw readings if there are few enough of them, then
+    daily rollups, then weekly ones, so a year of history costs ~52 rows however many readings it holds. Windows with
+    more weeks than max_points merge consecutive weeks into one point (resolution "2-week", "3-week"...), so a
+    response never holds more than max_points points.
+    Every point has min, max, avg, last and count. TDEE points are derived from the weight rollups with the profile's
+    current height, age, gender and activity level; TDEE rises linearly with weight so min/max/avg carry over exactly.
+    """
+    def get(self, request, profile_id):
+        query = HistoryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        metric = query.validated_data['metric']
+        max_points = query.validated_data['max_points']
+        end = query.validated_data.get('end') or timezone.now()
+        start = query.validated_data.get('start') or end - datetime.timedelta(days=30)
+        if start >= end:
+            raise serializers.ValidationError({'start': 'Must be before end.'})
+        try:
+            profile = Profile.objects.get(pk=profile_id)
+        except Profile.DoesNotExist:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        source = 'weight' if metric == 'tdee' else metric
+        resolution, points = 'raw', self.raw_points(profile_id, source, start, end, max_points)
+        if points is None:
+            week = MeasurementRollup.WEEK
+            weeks = (period_start(end, week) - period_start(start, week)).days // 7 + 1
+            if (end.date() - start.date()).days + 1 <= max_points:
+                resolution, days_per_point = MeasurementRollup.DAY, 1
+            elif weeks <= max_points:
+                resolution, days_per_point = MeasurementRollup.WEEK, 7
+            else:
+                weeks_per_point = math.ceil(weeks / max_points)
+                resolution, days_per_point = f'{weeks_per_point}-week', 7 * weeks_per_point
+            points = self.rollup_points(profile_id, source, resolution, start, end, days_per_point)
+
+        if metric == 'tdee':
+            points = [self.as_tdee(profile, point) for point in points]
+        return Response({
+            'metric': metric,
+            'resolution': resolution,
+            'start': start,
+            'end': end,
+            'points': points,
+        })
+
+    def raw_points(self, profile_id, metric, start, end, max_points):
+        # reading one row past the limit is enough to know the raw readings don't fit
+        rows = list(
+            Measurement.objects
+            .filter(profile_id=profile_id, recorded_at__gte=start, recorded_at__lt=end, **{f'{metric}__isnull': False})
+            .order_by('recorded_at')
+            .values_list('recorded_at', metric)[:max_points + 1]
+        )
+        if len(rows) > max_points:
+            return None
+        return [
+            {'time': recorded_at, 'min': value, 'max': value, 'avg': value, 'last': value, 'count': 1}
+            for recorded_at, value in rows
+        ]
+
+    def rollup_points(self, profile_id, metric, resolution, start, end, days_per_point):
+        # multi-week points are merged from the weekly rollups
+        stored = MeasurementRollup.DAY if resolution == MeasurementRollup.DAY else MeasurementRollup.WEEK
+        first = period_start(start, stored)
+        rows = (
+            MeasurementRollup.objects
+            .filter(
+                profile_id=profile_id,
+                resolution=stored,
+                period_start__gte=first,
+                period_start__lte=period_start(end, stored),
+                **{f'{metric}_count__gt': 0}
+            )
+            .order_by('period_start')
+            .values_list(
+                'period_start', f'{metric}_min', f'{metric}_max', f'{metric}_sum', f'{metric}_last', f'{metric}_count'
+            )
+        )
+        merged = {}
+        for day, low, high, total, last, count in rows:
+            time = first + datetime.timedelta(days=(day - first).days // days_per_point * days_per_point)
+            point = merged.get(time)
+            if point is None:
+                merged[time] = [low, high, total, last, count]
+            else:
+                # rows come oldest first, so the newest period's last value wins
+                merged[time] = [min(point[0], low), max(point[1], high), point[2] + total, last, point[4] + count]
+        return [
+            {'time': time, 'min': low, 'max': high, 'avg': total / count, 'last': last, 'count': count}
+            for time, (low, high, total, last, count) in merged.items()
+        ]
+
+    def as_tdee(self, profile, point):
+        tdee = {}
+        for key in ('min', 'max', 'avg', 'last'):
+            profile.weight = point[key]
+            tdee[key] = profile.calculate_tdee()
+        return dict(point, **tdee)
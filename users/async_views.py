@@ -0,0 +1,169 @@
+"""
+Async views for ASGI deployments (drf_api/asgi.py). DRF views are synchronous, so these are plain Django async views
+that read through the async ORM (aget, async iteration) and reuse ProfileSerializer for validation and output.
+Anything that has to stay synchronous (validators that query, Profile.save) goes through sync_to_async.
+"""
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views import View
+
+from . import hashing
+from .models import Profile
+from .serializers import ProfileReadSerializer, ProfileSerializer
+
+
+def json_body(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+async def serialize(*args, serializer_class=ProfileSerializer, **kwargs):
+    # building the representation is CPU work, so it runs on a worker thread and the event loop stays free. The
+    # instances must be fully loaded, a query from that thread would open its own connection.
+    return await sync_to_async(lambda: serializer_class(*args, **kwargs).data, thread_sensitive=False)()
+
+
+def save_registration(serializer, password_hash):
+    with transaction.atomic():
+        user, profile = serializer.build(serializer.validated_data)
+        user.password = password_hash
+        user.save()
+        profile.user = user
+        profile.save()
+    return profile
+
+
+async def register(request):
+    """
+    POST /profiles/register/ takes the same payload as POST /profiles/. The password is hashed in the bounded pool
+    from users/hashing.py while the worker serves other requests; when the pool is full the answer is 503.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    data = json_body(request)
+    if data is None:
+        return JsonResponse({'detail': 'Expected a JSON body.'}, status=400)
+
+    serializer = ProfileSerializer(data=data)
+    # the unique username/email validators query the database
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    try:
+        password_hash = await hashing.hash_password(serializer.validated_data['user'].pop('password'))
+    except hashing.PoolSaturated:
+        response = JsonResponse({'detail': 'Registration is busy, try again shortly.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    profile = await sync_to_async(save_registration)(serializer, password_hash)
+    return JsonResponse(await serialize(profile), status=201)
+
+
+# Like the DRF views, which only check CSRF for session-authenticated requests. Set by hand because the csrf_exempt
+# decorator in Django 4.2 wraps the view in a sync function, which would hide that it is async.
+register.csrf_exempt = True
+
+
+class AsyncProfileView(View):
+    # CSRF exempt for the same reason as register()
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    def read_queryset(self):
+        return Profile.objects.values(*ProfileReadSerializer.columns())
+
+
+class AsyncProfileListView(AsyncProfileView):
+    """
+    GET  /profiles/async/?cursor=&page_size= lists profiles newest first with a (created_at, id) keyset cursor, the
+         same order as the /profiles/ cursor pagination.
+    POST /profiles/async/ registers a profile, see register().
+    """
+    page_size = 10
+    max_page_size = 100
+
+    async def get(self, request):
+        try:
+            page_size = min(int(request.GET.get('page_size', self.page_size)), self.max_page_size)
+        except ValueError:
+            page_size = self.page_size
+        queryset = self.read_queryset().order_by('-created_at', '-id')
+        if 'cursor' in request.GET:
+            position = self.decode_cursor(request.GET['cursor'])
+            if position is None:
+                return JsonResponse({'detail': 'Invalid cursor'}, status=404)
+            created_at, pk = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        rows = [row async for row in queryset[:max(page_size, 1) + 1]]
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            query = request.GET.copy()
+            query['cursor'] = self.encode_cursor(rows[-1])
+            next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        results = await serialize(rows, many=True, serializer_class=ProfileReadSerializer)
+        return JsonResponse({'next': next_url, 'results': results})
+
+    async def post(self, request):
+        return await register(request)
+
+    def encode_cursor(self, row):
+        position = json.dumps([row['created_at'].isoformat(), row['id']])
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            created_at = parse_datetime(created_at)
+        except (binascii.Error, ValueError, TypeError):
+            return None
+        if created_at is None or not isinstance(pk, int):
+            return None
+        return created_at, pk
+
+
+class AsyncProfileDetailView(AsyncProfileView):
+    """GET, PUT and PATCH /profiles/async/{id}/, with the same payloads and output as /profiles/{id}/."""
+
+    async def get(self, request, pk):
+        try:
+            row = await self.read_queryset().aget(pk=pk)
+        except Profile.DoesNotExist:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+        return JsonResponse(await serialize(row, serializer_class=ProfileReadSerializer))
+
+    async def put(self, request, pk):
+        return await self.update(request, pk, partial=False)
+
+    async def patch(self, request, pk):
+        return await self.update(request, pk, partial=True)
+
+    async def update(self, request, pk, partial):
+        data = json_body(request)
+        if data is None:
+            return JsonResponse({'detail': 'Expected a JSON body.'}, status=400)
+        try:
+            # a full row, Profile.save writes every field
+            profile = await Profile.objects.select_related('user').aget(pk=pk)
+        except Profile.DoesNotExist:
+            return JsonResponse({'detail': 'Not found.'}, status=404)
+
+        serializer = ProfileSerializer(profile, data=data, partial=partial)
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+        await sync_to_async(serializer.save)()
+        return JsonResponse(await serialize(profile))
@@ -0,0 +1,117 @@
+"""
+JWT authentication without the per-request user query.
+
+Tokens are issued by VersionedTokenObtainPairSerializer (REST_AUTH_SERIALIZERS['JWT_TOKEN_CLAIMS_SERIALIZER']) and
+carry the username, staff flags and the user's token_version. StatelessJWTCookieAuthentication checks that version
+against a cache entry that lives JWT_TOKEN_VERSION_CACHE_TIMEOUT seconds and answers with a ClaimsUser, which only
+loads the CustomUser row when something outside the claims is read.
+
+CustomUser.revoke_tokens() bumps the version and the post_save signal drops the cache entry, so revocation is
+immediate with a shared cache and takes at most the timeout with the per-process default. Saving a new password
+(CustomUser.set_password) and deactivating a user revoke the same way. Staff flags in a token stay as issued until it
+expires, so revoke tokens when they change. Tokens from before the version claim existed fall back to the normal user
+lookup.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from dj_rest_auth.jwt_auth import JWTCookieAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+VERSION_CLAIM = 'ver'
+REVOKED = -1
+
+
+def version_cache_key(user_id):
+    return f'users:token-version:{user_id}'
+
+
+def current_token_version(user_id):
+    """The user's token_version, or REVOKED for a missing or inactive user. One query per cache timeout."""
+    key = version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # always the primary: list and retrieve are already on a replica when DRF authenticates, and a lagging one
+        # would cache a revoked version again right after revoke_tokens() dropped it
+        version = (
+            CustomUser.objects.using('default').filter(pk=user_id, is_active=True)
+            .values_list('token_version', flat=True).first()
+        )
+        if version is None:
+            version = REVOKED
+        cache.set(key, version, settings.JWT_TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[VERSION_CLAIM] = user.token_version
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
+
+class ClaimsUser:
+    """
+    request.user built from the token. id, username, is_staff and is_superuser come from the claims; reading anything
+    else (email, profile, has_perm...) loads the CustomUser row once, which is also available as user_object.
+    Attribute writes go to user_object too, so request.user.email = ...; request.user.save() saves them.
+    """
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        user_id = int(token[api_settings.USER_ID_CLAIM])
+        # straight into __dict__, __setattr__ would load the row
+        self.__dict__.update(
+            id=user_id, pk=user_id, username=token.get('username', ''), is_staff=bool(token.get('is_staff', False)),
+            is_superuser=bool(token.get('is_superuser', False)),
+        )
+
+    @cached_property
+    def user_object(self):
+        return CustomUser.objects.get(pk=self.pk)
+
+    def __getattr__(self, name):
+        # only called for attributes the claims don't cover
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.user_object, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.user_object, name, value)
+        if name in self.__dict__:
+            # a claim, reads keep coming from here
+            self.__dict__[name] = value
+
+    def __eq__(self, other):
+        return isinstance(other, (ClaimsUser, CustomUser)) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.username
+
+
+class StatelessJWTCookieAuthentication(JWTCookieAuthentication):
+    """JWTCookieAuthentication that answers with a ClaimsUser instead of loading the user, see the module docstring."""
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+        if validated_token[VERSION_CLAIM] != current_token_version(user_id):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        return ClaimsUser(validated_token)
@@ -0,0 +1,35 @@
+from django.db import transaction
+
+from . import stats
+from .models import CustomUser, Profile, ProfileStatsBucket
+
+
+def bulk_save_profiles(users, profiles, batch_size=500):
+    """
+    Writes unsaved users and their profiles (matched by position) with two bulk_create calls in one transaction.
+    Passwords must already be hashed on the users. Returns the saved profiles.
+    """
+    with transaction.atomic():
+        CustomUser.objects.bulk_create(users, batch_size=batch_size)
+
+        # Backends that can't return ids from a bulk insert (MySQL, old SQLite) need one lookup to get them back
+        if users and users[0].pk is None:
+            ids = dict(
+                CustomUser.objects
+                .filter(username__in=[user.username for user in users])
+                .values_list('username', 'pk')
+            )
+            for user in users:
+                user.pk = ids[user.username]
+
+        for user, profile in zip(users, profiles):
+            profile.user = user
+            profile.normalize_measurements()
+        Profile.objects.bulk_create(profiles, batch_size=batch_size)
+
+        # bulk_create skips save(), so the population stats are updated here
+        for profile in profiles:
+            profile._stats_entries = stats.profile_entries(profile)
+        ProfileStatsBucket.objects.apply([], [entry for profile in profiles for entry in profile._stats_entries])
+
+    return profiles
@@ -0,0 +1,124 @@
+"""
+Stateless BMR/TDEE/body fat for /profiles/calculate/, for people who have no profile. A batch is read into columns in
+one pass over the payloads, then unit conversion and the formulas run once over the whole batch with NumPy. Nothing is
+stored and the database is never touched.
+
+The arithmetic is the same as Profile.normalize_measurements, Profile.calculate_tdee (through users/tdee.py) and the
+Deurenberg estimate in ProfileSerializer, so a calculation gives the numbers the profile would get.
+"""
+import math
+
+import numpy as np
+
+from . import tdee
+from .models import Profile
+
+KG_PER_LB = 0.45359237
+CM_PER_INCH = 2.54
+GENDERS = ('M', 'F', 'O')
+WEIGHT_UNITS = tuple(unit for unit, _ in Profile.WEIGHT_UNITS)
+HEIGHT_UNITS = tuple(unit for unit, _ in Profile.HEIGHT_UNITS)
+
+
+def number(item, field, errors, required=True, allow_zero=False):
+    """The item's field as a positive float (or zero), NaN when it is missing (an error if required)."""
+    value = item.get(field)
+    if value is None or value == '':
+        if required:
+            errors[field] = ['This field is required.']
+        return math.nan
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        value = float(value)
+    except (TypeError, ValueError):
+        errors[field] = ['A valid number is required.']
+        return math.nan
+    if not math.isfinite(value) or value < 0 or (value == 0 and not allow_zero):
+        errors[field] = ['Must be a number of at least 0.' if allow_zero else 'Must be a number greater than 0.']
+        return math.nan
+    return value
+
+
+def choice(item, field, choices, errors, default=None):
+    value = item.get(field, default)
+    if value not in choices:
+        errors[field] = [f'Must be one of {", ".join(choices)}.']
+        return choices[0]
+    return value
+
+
+def parse(items):
+    """
+    Returns (columns, errors). columns maps each input to an array (or a list for the string ones), errors is a list
+    of {'index', 'errors'} for the items that didn't validate.
+    """
+    size = len(items)
+    weight = np.empty(size)
+    height = np.empty(size)
+    feet = np.zeros(size)
+    inches = np.zeros(size)
+    age = np.empty(size)
+    body_fat = np.empty(size)
+    waist = np.empty(size)
+    hip = np.empty(size)
+    pounds = np.zeros(size, dtype=bool)
+    imperial_height = np.zeros(size, dtype=bool)
+    gender = []
+    activity_level = []
+    errors = []
+    for index, item in enumerate(items):
+        item_errors = {}
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'errors': {'non_field_errors': ['Expected an object.']}})
+            gender.append('M')
+            activity_level.append('Sedentary')
+            continue
+        gender.append(choice(item, 'gender', GENDERS, item_errors))
+        activity_level.append(choice(item, 'activity_level', tuple(Profile.ACTIVITY_LEVEL_MULTIPLIERS), item_errors))
+        age[index] = number(item, 'age', item_errors)
+        weight[index] = number(item, 'weight', item_errors)
+        pounds[index] = choice(item, 'weight_unit', WEIGHT_UNITS, item_errors, default='kg') == 'lb'
+        if choice(item, 'height_unit', HEIGHT_UNITS, item_errors, default='cm') == 'ft':
+            imperial_height[index] = True
+            feet[index] = number(item, 'height_feet', item_errors)
+            inches[index] = number(item, 'height_inches', item_errors, allow_zero=True)
+        else:
+            height[index] = number(item, 'height', item_errors)
+        body_fat[index] = number(item, 'body_fat', item_errors, required=False)
+        waist[index] = number(item, 'waist_measurement', item_errors, required=False)
+        hip[index] = number(item, 'hip_measurement', item_errors, required=False)
+        if math.isnan(waist[index]) != math.isnan(hip[index]):
+            item_errors.setdefault('non_field_errors', []).append(
+                'Both waist_measurement and hip_measurement are needed to estimate body fat.'
+            )
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+
+    columns = {
+        'weight': weight, 'pounds': pounds, 'height': height, 'imperial_height': imperial_height, 'feet': feet,
+        'inches': inches, 'age': age, 'gender': gender, 'activity_level': activity_level, 'body_fat': body_fat,
+        'waist': waist, 'hip': hip,
+    }
+    return columns, errors
+
+
+def calculate(columns):
+    """
+    Returns a list of {'bmr', 'tdee', 'body_fat'} dicts. body_fat is estimated from waist and hip when both are given,
+    otherwise it is the one given, or None.
+    """
+    weight = np.where(columns['pounds'], columns['weight'] * KG_PER_LB, columns['weight'])
+    height = np.where(
+        columns['imperial_height'], (columns['feet'] * 12 + columns['inches']) * CM_PER_INCH, columns['height']
+    )
+    bmr = tdee.calculate_bmr(weight, height, columns['age'], columns['gender'])
+    total = bmr * tdee.activity_multipliers(columns['activity_level'])
+    waist, hip = columns['waist'], columns['hip']
+    # like ProfileSerializer.build, waist and hip override a given body_fat
+    estimate = ~np.isnan(waist)
+    body_fat = np.where(estimate, (waist - hip) / np.where(estimate, waist, 1.0) * 100, columns['body_fat'])
+    return [
+        {'bmr': item_bmr, 'tdee': item_tdee, 'body_fat': None if math.isnan(item_body_fat) else item_body_fat}
+        for item_bmr, item_tdee, item_body_fat in zip(bmr.tolist(), total.tolist(), body_fat.tolist())
+    ]
@@ -0,0 +1,35 @@
+import django_filters
+from rest_framework.filters import OrderingFilter
+
+from .models import Profile
+
+
+class ProfileFilter(django_filters.FilterSet):
+    """
+    /profiles/?activity_level=Very Active&gender=F&age_min=30&age_max=40&TDEE_min=2000&TDEE_max=2500&username=ann
+    Every combination here has an index on Profile to search with, see Profile.Meta.indexes.
+    """
+    activity_level = django_filters.MultipleChoiceFilter(choices=Profile._meta.get_field('activity_level').choices)
+    gender = django_filters.ChoiceFilter(choices=Profile._meta.get_field('gender').choices)
+    age = django_filters.RangeFilter()
+    TDEE = django_filters.RangeFilter()
+    username = django_filters.CharFilter(method='filter_username_prefix', label='Username starts with')
+
+    class Meta:
+        model = Profile
+        fields = ('activity_level', 'gender', 'age', 'TDEE', 'username')
+
+    def filter_username_prefix(self, queryset, name, value):
+        # a range rather than LIKE 'value%', so any database can answer it from the unique username index
+        # (SQLite's LIKE is case-insensitive and can't use it). Matching is case-sensitive.
+        return queryset.filter(user__username__gte=value, user__username__lt=value[:-1] + chr(ord(value[-1]) + 1))
+
+
+class ProfileOrderingFilter(OrderingFilter):
+    """?ordering=-updated_at, with id added as a tiebreaker so equal values keep a stable order across pages."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return ordering
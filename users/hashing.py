@@ -0,0 +1,63 @@
+"""
+A bounded pool for password hashing, used by the async registration view. Hashing is the slow part of registering
+(PBKDF2 runs for hundreds of milliseconds), so it runs in a thread pool (hashlib releases the GIL while it works) or a
+process pool, and the event loop keeps serving other requests meanwhile. At most PASSWORD_HASH_WORKERS hashes run and
+PASSWORD_HASH_MAX_QUEUE wait; past that PoolSaturated is raised so the view can answer 503 instead of piling up work.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def pool():
+    """Returns (executor, slots), created on first use from the settings."""
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.PASSWORD_HASH_WORKERS
+            if settings.PASSWORD_HASH_EXECUTOR == 'process':
+                # forked children inherit the configured settings, so make_password works there as is
+                _executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+            else:
+                _executor = ThreadPoolExecutor(workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + settings.PASSWORD_HASH_MAX_QUEUE)
+        return _executor, _slots
+
+
+async def hash_password(raw_password):
+    executor, slots = pool()
+    if not slots.acquire(blocking=False):
+        raise PoolSaturated()
+    try:
+        future = executor.submit(make_password, raw_password)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is held until the hash is done (or cancelled before it started), not until the awaiting request
+    # goes away, so disconnecting clients can't push more work into the pool than its bound
+    future.add_done_callback(lambda _: slots.release())
+    return await asyncio.wrap_future(future)
+
+
+@receiver(setting_changed)
+def reset(setting=None, **kwargs):
+    global _executor, _slots
+    if setting in (None, 'PASSWORD_HASH_EXECUTOR', 'PASSWORD_HASH_WORKERS', 'PASSWORD_HASH_MAX_QUEUE'):
+        with _lock:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = _slots = None
@@ -0,0 +1,133 @@
+"""
+Pieces of the import_profiles command. Rows are read lazily from a CSV or NDJSON file, validated and turned into
+unsaved users and profiles by worker processes (ProfileSerializer.validate rules, and the password hash, which is
+where the CPU goes), then written by the parent a batch per transaction with bulk_save_profiles.
+"""
+import csv
+import json
+import os
+
+from django.db import IntegrityError, connections, transaction
+
+from .bulk import bulk_save_profiles
+from .serializers import ProfileSerializer
+
+USER_FIELDS = ('username', 'email', 'password')
+
+
+def read_rows(path, file_format):
+    """Yields (row_number, row) with 1-based data row numbers; a row that isn't valid JSON comes back as a str."""
+    with open(path, newline='') as source:
+        if file_format == 'csv':
+            for number, row in enumerate(csv.DictReader(source), start=1):
+                # empty cells mean "not given", not an empty string
+                yield number, {key: value for key, value in row.items() if value not in ('', None)}
+        else:
+            for number, line in enumerate(source, start=1):
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, line
+
+
+def as_payload(row):
+    """Nests flat username/email/password columns under 'user', the shape ProfileSerializer takes."""
+    payload = dict(row)
+    if 'user' not in payload:
+        payload['user'] = {field: payload.pop(field) for field in USER_FIELDS if field in payload}
+    return payload
+
+
+def batches(rows, size, skip_through=0):
+    batch = []
+    for number, row in rows:
+        if number <= skip_through:
+            continue
+        batch.append((number, row))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def redact(row):
+    """The row as written to the rejects file, without its password."""
+    if not isinstance(row, dict):
+        return row
+    row = {key: value for key, value in row.items() if key != 'password'}
+    if isinstance(row.get('user'), dict):
+        row['user'] = {key: value for key, value in row['user'].items() if key != 'password'}
+    return row
+
+
+def prepare_batch(batch):
+    """
+    Runs in a worker. Returns (accepted, rejected): accepted holds (row_number, user, profile) ready for insertion
+    with the password already hashed, rejected holds (row_number, row, errors).
+    """
+    accepted = []
+    rejected = []
+    for number, row in batch:
+        if not isinstance(row, dict):
+            rejected.append((number, row, {'non_field_errors': ['Not a JSON object.']}))
+            continue
+        serializer = ProfileSerializer(data=as_payload(row))
+        if serializer.is_valid():
+            user, profile = serializer.build(serializer.validated_data)
+            accepted.append((number, user, profile))
+        else:
+            rejected.append((number, redact(row), serializer.errors))
+    return accepted, rejected
+
+
+def save_batch(accepted):
+    """
+    Writes a prepared batch in one transaction. If it clashes with an existing user (say a username repeated further
+    down the file) the batch is retried row by row and only the clashing rows are returned as rejects.
+    """
+    if not accepted:
+        return 0, []
+    try:
+        bulk_save_profiles([user for _, user, _ in accepted], [profile for _, _, profile in accepted])
+        return len(accepted), []
+    except IntegrityError:
+        pass
+
+    saved = 0
+    rejected = []
+    for number, user, profile in accepted:
+        # forget any id handed out by the rolled back bulk insert
+        user.pk = None
+        user._state.adding = True
+        try:
+            with transaction.atomic():
+                user.save()
+                profile.user = user
+                profile.save()
+            saved += 1
+        except IntegrityError as error:
+            rejected.append((number, {'username': user.username, 'email': user.email}, {'non_field_errors': [str(error)]}))
+    return saved, rejected
+
+
+def close_connections():
+    connections.close_all()
+
+
+def read_checkpoint(path, source):
+    """Returns the last row number committed for this source file, 0 if there is no checkpoint for it."""
+    try:
+        with open(path) as checkpoint:
+            state = json.load(checkpoint)
+    except (OSError, ValueError):
+        return 0
+    return state['row'] if state.get('source') == os.path.abspath(source) else 0
+
+
+def write_checkpoint(path, source, row):
+    # write then rename, so a crash mid-write leaves the previous checkpoint intact
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'source': os.path.abspath(source), 'row': row}, checkpoint)
+    os.replace(temporary, path)
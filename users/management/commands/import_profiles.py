@@ -0,0 +1,71 @@
+import json
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports profiles from a CSV or NDJSON file. Rows are validated with ProfileSerializer and their passwords '
+        'hashed in a process pool, then written a batch per transaction. Resumes from its checkpoint after a crash.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='taken from the file extension when left out')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=500, help='rows per worker task and per transaction')
+        parser.add_argument('--checkpoint', help='defaults to <path>.checkpoint')
+        parser.add_argument('--rejects', help='defaults to <path>.rejects.ndjson')
+        parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        rejects_path = options['rejects'] or f'{path}.rejects.ndjson'
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1.')
+
+        resume_after = 0 if options['restart'] else importer.read_checkpoint(checkpoint, path)
+        if resume_after:
+            self.stdout.write(f'Resuming after row {resume_after}.')
+        work = importer.batches(importer.read_rows(path, file_format), options['batch_size'], resume_after)
+
+        start = time.perf_counter()
+        imported = rejected = 0
+        # rejects from before the crash are kept when resuming
+        with open(rejects_path, 'a' if resume_after else 'w') as rejects:
+            if options['workers'] == 1:
+                results = map(importer.prepare_batch, work)
+                imported, rejected = self.write(results, rejects, checkpoint, path)
+            else:
+                importer.close_connections()
+                context = multiprocessing.get_context('fork')
+                with context.Pool(options['workers'], initializer=importer.close_connections) as pool:
+                    # imap keeps batches in file order, so the checkpoint only ever moves forward
+                    results = pool.imap(importer.prepare_batch, work)
+                    imported, rejected = self.write(results, rejects, checkpoint, path)
+        elapsed = time.perf_counter() - start
+
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} profiles, rejected {rejected} rows (see {rejects_path}) in {elapsed:.1f}s, '
+            f'{rate:.0f} rows/s.'
+        ))
+
+    def write(self, results, rejects, checkpoint, path):
+        imported = rejected = 0
+        for accepted, invalid in results:
+            saved, clashes = importer.save_batch(accepted)
+            imported += saved
+            for number, row, errors in sorted(invalid + clashes, key=lambda reject: reject[0]):
+                rejects.write(json.dumps({'row': number, 'data': row, 'errors': errors}, default=str) + '\n')
+                rejected += 1
+            rejects.flush()
+            last_row = max(number for number, *_ in accepted + invalid)
+            importer.write_checkpoint(checkpoint, path, last_row)
+        return imported, rejected
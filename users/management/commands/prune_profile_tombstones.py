@@ -0,0 +1,19 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import ProfileTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes profile tombstones older than PROFILE_SYNC_WATERMARK_MAX_AGE. No delta sync watermark that still '
+        'works can need them.'
+    )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.PROFILE_SYNC_WATERMARK_MAX_AGE)
+        deleted, _ = ProfileTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones deleted before {cutoff.isoformat()}.'))
@@ -0,0 +1,56 @@
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users import stats
+from users.models import Profile, ProfileStatsBucket
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the ProfileStatsBucket summary behind /profiles/stats/ from a full scan of Profile, '
+        'or with --check compares the two and fails on any difference.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='compare only, exit with an error on drift')
+        parser.add_argument(
+            '--tolerance', type=float, default=1e-6, help='relative difference allowed between totals in --check'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['check']:
+            self.check_buckets(options['tolerance'])
+        else:
+            self.rebuild()
+        self.stdout.write(f'Done in {time.perf_counter() - start:.2f}s.')
+
+    def rebuild(self):
+        with transaction.atomic():
+            ProfileStatsBucket.objects.select_for_update().all().delete()
+            created = ProfileStatsBucket.objects.bulk_create([
+                ProfileStatsBucket(**dict(zip(ProfileStatsBucket.KEY_FIELDS, key)), count=count, total=total)
+                for key, (count, total) in stats.scan(Profile.objects.all()).items()
+            ], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(created)} buckets.'))
+
+    def check_buckets(self, tolerance):
+        expected = stats.scan(Profile.objects.all())
+        stored = {
+            row[:-2]: list(row[-2:])
+            for row in ProfileStatsBucket.objects.exclude(count=0).values_list(*ProfileStatsBucket.KEY_FIELDS, 'count', 'total')
+        }
+        drift = []
+        for key in sorted(set(expected) | set(stored), key=str):
+            want = expected.get(key, [0, 0.0])
+            have = stored.get(key, [0, 0.0])
+            if want[0] != have[0] or not math.isclose(want[1], have[1], rel_tol=tolerance, abs_tol=tolerance):
+                drift.append(f'{key}: expected count {want[0]} total {want[1]:g}, stored count {have[0]} total {have[1]:g}')
+        for line in drift[:20]:
+            self.stderr.write(line)
+        if drift:
+            raise CommandError(f'{len(drift)} of {len(expected)} buckets differ, run rebuild_profile_stats to fix them.')
+        self.stdout.write(self.style.SUCCESS(f'All {len(expected)} buckets match.'))
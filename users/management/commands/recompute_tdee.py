@@ -0,0 +1,50 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from users.tdee import chunk_bounds, recompute_chunk
+
+
+def close_connections():
+    # forked workers must open their own connections instead of sharing the parent's socket
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Recomputes BMR/TDEE for every profile in chunks with the vectorized engine in users/tdee.py.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='profiles loaded and written per chunk')
+        parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size < 1 or workers < 1:
+            self.stderr.write('--chunk-size and --workers must be at least 1.')
+            return
+
+        start = time.perf_counter()
+        bounds = chunk_bounds(chunk_size)
+        if workers == 1:
+            read, updated = self.collect(map(recompute_chunk, bounds))
+        else:
+            close_connections()
+            with multiprocessing.get_context('fork').Pool(workers, initializer=close_connections) as pool:
+                read, updated = self.collect(pool.imap_unordered(recompute_chunk, bounds))
+        elapsed = time.perf_counter() - start
+
+        rate = read / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {read} profiles ({updated} changed) in {elapsed:.2f}s, {rate:.0f} rows/s '
+            f'with {workers} worker(s) and chunks of {chunk_size}.'
+        ))
+
+    def collect(self, results):
+        read = updated = 0
+        for chunk_read, chunk_updated in results:
+            read += chunk_read
+            updated += chunk_updated
+        return read, updated
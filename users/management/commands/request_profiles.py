@@ -0,0 +1,57 @@
+import io
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drf_api import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Lists and summarizes the request profiles saved by drf_api.profiling, '
+        'and issues tokens for the X-Profile-Request header.'
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='subcommand', required=True)
+        subcommands.add_parser('list', help='saved profiles, oldest first')
+        show = subcommands.add_parser('show', help='the top functions of one profile')
+        show.add_argument('name', help='file name from `list`, or "latest"')
+        show.add_argument('--sort', default='cumulative', help='a pstats sort key, e.g. cumulative, tottime, ncalls')
+        show.add_argument('--limit', type=int, default=30, help='functions to print')
+        show.add_argument('--filter', help='only functions whose file:line(name) matches this regex')
+        subcommands.add_parser('token', help='a token for the X-Profile-Request header')
+
+    def handle(self, *args, **options):
+        getattr(self, f'handle_{options["subcommand"]}')(options)
+
+    def handle_token(self, options):
+        self.stdout.write(profiling.issue_token())
+
+    def handle_list(self, options):
+        profiles = profiling.stored_profiles()
+        total = 0
+        for path in profiles:
+            stats = pstats.Stats(str(path))
+            size = path.stat().st_size
+            total += size
+            self.stdout.write(f'{path.name}  {stats.total_tt * 1000:9.1f} ms  {stats.total_calls:8} calls  {size:9} bytes')
+        self.stdout.write(f'{len(profiles)} profiles, {total} bytes in {profiling.profile_dir()}')
+
+    def handle_show(self, options):
+        profiles = profiling.stored_profiles()
+        if options['name'] == 'latest':
+            if not profiles:
+                raise CommandError('No profiles saved.')
+            path = profiles[-1]
+        else:
+            path = profiling.profile_dir() / options['name']
+            if path not in profiles:
+                raise CommandError(f'No profile named {options["name"]}.')
+
+        output = io.StringIO()
+        stats = pstats.Stats(str(path), stream=output).strip_dirs().sort_stats(options['sort'])
+        restrictions = [options['filter']] if options['filter'] else []
+        stats.print_stats(*restrictions, options['limit'])
+        self.stdout.write(path.name)
+        self.stdout.write(output.getvalue())
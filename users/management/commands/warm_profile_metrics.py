@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users import metrics
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Fills the profile metrics cache for active users, so their first /profiles/{id}/metrics/ is a hit.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='only users who logged in within this many days')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='profiles loaded and cached per chunk')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(days=options['days'])
+        profiles = (
+            Profile.objects
+            .filter(user__is_active=True, user__last_login__gte=since)
+            .only('pk', 'gender', 'weight', 'height', 'age', 'activity_level', 'body_fat')
+            .order_by('pk')
+        )
+
+        warmed = 0
+        chunk = []
+        for profile in profiles.iterator(chunk_size=options['chunk_size']):
+            chunk.append(profile)
+            if len(chunk) == options['chunk_size']:
+                metrics.store_many(chunk)
+                warmed += len(chunk)
+                chunk = []
+        if chunk:
+            metrics.store_many(chunk)
+            warmed += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Cached metrics for {warmed} profiles.'))
@@ -0,0 +1,83 @@
+"""
+Derived numbers for a profile (BMR, TDEE, calorie targets, body composition), cached per profile with Django's cache
+framework. Entries are dropped by the signals in users/signals.py whenever a profile is saved or deleted; bumping
+METRICS_VERSION retires every cached entry at once when a formula changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+METRICS_VERSION = 1
+# kcal per day relative to TDEE
+CALORIE_TARGETS = {
+    'lose': -500,
+    'maintain': 0,
+    'gain': 500,
+}
+HITS_KEY = 'profile-metrics:hits'
+MISSES_KEY = 'profile-metrics:misses'
+
+
+def cache_key(pk):
+    return f'profile-metrics:v{METRICS_VERSION}:{pk}'
+
+
+def calculate_metrics(profile):
+    tdee = profile.calculate_tdee()
+    metrics = {
+        'version': METRICS_VERSION,
+        'bmr': profile.calculate_bmr(),
+        'tdee': tdee,
+        'calorie_targets': {goal: tdee + offset for goal, offset in CALORIE_TARGETS.items()},
+        'body_fat': profile.body_fat,
+        'fat_mass': None,
+        'lean_mass': None,
+    }
+    if profile.body_fat is not None:
+        metrics['fat_mass'] = profile.weight * profile.body_fat / 100
+        metrics['lean_mass'] = profile.weight - metrics['fat_mass']
+    return metrics
+
+
+def get_cached(pk):
+    metrics = cache.get(cache_key(pk))
+    count(HITS_KEY if metrics is not None else MISSES_KEY)
+    return metrics
+
+
+def store(profile, metrics=None):
+    metrics = metrics or calculate_metrics(profile)
+    cache.set(cache_key(profile.pk), metrics, settings.PROFILE_METRICS_CACHE_TIMEOUT)
+    return metrics
+
+
+def store_many(profiles):
+    cache.set_many(
+        {cache_key(profile.pk): calculate_metrics(profile) for profile in profiles},
+        settings.PROFILE_METRICS_CACHE_TIMEOUT,
+    )
+
+
+def invalidate(*pks):
+    cache.delete_many([cache_key(pk) for pk in pks])
+
+
+def count(key):
+    # counters live in the cache too, so every worker adds to the same numbers when the cache is shared
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.add(key, 1, timeout=None)
+
+
+def stats():
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / lookups if lookups else None,
+    }
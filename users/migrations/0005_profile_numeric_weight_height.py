@@ -0,0 +1,149 @@
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# 'in' was the code behind the old "Feet" choice. 'm' was only the column default (never a choice), validate() always
+# stored cm, so see parse_height for it
+CM_PER_UNIT = {'cm': 1.0, 'in': 2.54, 'ft': 30.48}
+# anything outside this after conversion means the unit and the value disagree
+PLAUSIBLE_HEIGHT_CM = (50, 272)
+# an 'm' height below this is taken as meters
+MAX_HEIGHT_M = 3
+FEET_AND_INCHES = re.compile(r'''^\s*(\d+)\s*(?:'|ft)\s*(\d+(?:\.\d+)?)?\s*(?:"|in)?\s*$''')
+
+
+def parse_weight(value, unit):
+    kilograms = float(re.sub(r'[a-z\s]', '', value.lower()))
+    return kilograms * 0.45359237 if unit == 'lb' else kilograms
+
+
+def parse_height(value, unit):
+    match = FEET_AND_INCHES.match(value)
+    if match:
+        feet, inches = match.groups()
+        centimeters = (int(feet) * 12 + float(inches or 0)) * 2.54
+    elif unit == 'm':
+        # the default label on a cm value, unless it can only be meters
+        centimeters = float(re.sub(r'[a-z\s]', '', value.lower()))
+        if centimeters < MAX_HEIGHT_M:
+            centimeters *= 100
+    elif unit in CM_PER_UNIT:
+        centimeters = float(re.sub(r'[a-z\s]', '', value.lower())) * CM_PER_UNIT[unit]
+    else:
+        raise ValueError(f'unknown height unit {unit!r}')
+    if not PLAUSIBLE_HEIGHT_CM[0] <= centimeters <= PLAUSIBLE_HEIGHT_CM[1]:
+        raise ValueError(f'{value!r} {unit} is {centimeters:g} cm')
+    return centimeters
+
+
+def strings_to_numbers(apps, schema_editor):
+    """
+    Copies the old string columns into the numeric ones a batch at a time, normalised to kg and cm. Heights are read
+    in their stored unit, 'm' ones as cm unless they are under 3. Rows that can't be parsed, or whose height comes out
+    implausible (5.9 in 'm'), stop the migration with the profile id, rather than being guessed at.
+    """
+    Profile = apps.get_model('users', 'Profile')
+    last_pk = 0
+    while True:
+        batch = list(
+            Profile.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'weight', 'height', 'weight_unit', 'height_unit')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for profile in batch:
+            try:
+                profile.weight_numeric = parse_weight(profile.weight, profile.weight_unit)
+                profile.height_numeric = parse_height(profile.height, profile.height_unit)
+            except ValueError as error:
+                raise ValueError(
+                    f'Profile {profile.pk} has a weight ({profile.weight!r}) or height ({profile.height!r} '
+                    f'{profile.height_unit}) that can\'t be converted ({error}), fix it before migrating.'
+                )
+            profile.weight_unit = 'kg'
+            profile.height_unit = 'cm'
+        Profile.objects.bulk_update(batch, ['weight_numeric', 'height_numeric', 'weight_unit', 'height_unit'])
+        last_pk = batch[-1].pk
+
+
+def numbers_to_strings(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    last_pk = 0
+    while True:
+        batch = list(
+            Profile.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'weight_numeric', 'height_numeric')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for profile in batch:
+            profile.weight = str(profile.weight_numeric)
+            profile.height = str(profile.height_numeric)
+        Profile.objects.bulk_update(batch, ['weight', 'height'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_height_feet_profile_height_inches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='weight_numeric',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='height_numeric',
+            field=models.FloatField(null=True),
+        ),
+        # nullable so that unapplying can add the string columns back before refilling them
+        migrations.AlterField(
+            model_name='profile',
+            name='weight',
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='height',
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.RunPython(strings_to_numbers, numbers_to_strings),
+        migrations.RemoveField(
+            model_name='profile',
+            name='weight',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='height',
+        ),
+        migrations.RenameField(
+            model_name='profile',
+            old_name='weight_numeric',
+            new_name='weight',
+        ),
+        migrations.RenameField(
+            model_name='profile',
+            old_name='height_numeric',
+            new_name='height',
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='weight',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='height',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='height_unit',
+            field=models.CharField(choices=[('cm', 'Centimeters'), ('ft', 'Feet')], default='cm', max_length=3),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_customuser_token_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['activity_level', 'created_at', 'id'], name='profile_activity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['activity_level', 'TDEE'], name='profile_activity_tdee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['gender', 'age'], name='profile_gender_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['TDEE'], name='profile_tdee_idx'),
+        ),
+    ]
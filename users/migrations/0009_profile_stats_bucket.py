@@ -0,0 +1,59 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:31
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Floor
+
+# the binning of users/stats.py when this migration was written, copied so later changes there can't alter it
+BIN_WIDTHS = {'TDEE': 50.0, 'body_fat': 1.0}
+AGE_BUCKET_YEARS = 10
+
+
+def build_stats(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    ProfileStatsBucket = apps.get_model('users', 'ProfileStatsBucket')
+    buckets = []
+    for metric, width in BIN_WIDTHS.items():
+        rows = (
+            Profile.objects.filter(**{f'{metric}__isnull': False})
+            .annotate(age_bucket=F('age') / AGE_BUCKET_YEARS * AGE_BUCKET_YEARS, bin=Floor(F(metric) / width))
+            .values('activity_level', 'gender', 'age_bucket', 'bin')
+            .annotate(count=Count('pk'), total=Sum(metric))
+            .order_by()
+        )
+        buckets += [
+            ProfileStatsBucket(
+                metric=metric, activity_level=row['activity_level'], gender=row['gender'],
+                age_bucket=int(row['age_bucket']), bin=int(row['bin']), count=row['count'], total=row['total'],
+            )
+            for row in rows
+        ]
+    ProfileStatsBucket.objects.bulk_create(buckets, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_profile_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStatsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('TDEE', 'TDEE'), ('body_fat', 'body_fat')], max_length=20)),
+                ('activity_level', models.CharField(max_length=20)),
+                ('gender', models.CharField(max_length=10)),
+                ('age_bucket', models.IntegerField()),
+                ('bin', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='profilestatsbucket',
+            constraint=models.UniqueConstraint(fields=('metric', 'activity_level', 'gender', 'age_bucket', 'bin'), name='profile_stats_bucket_key'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.8 on 2026-10-18 09:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_profile_stats_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['updated_at', 'id'], name='profile_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profiletombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_id_idx'),
+        ),
+    ]
@@ -1,9 +1,27 @@
-from django.db import models
+import functools
+import operator
+
+from django.db import connections, models, router, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth.models import AbstractUser
+from . import stats
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
+    # carried in every JWT (users/authentication.py), bumping it revokes the user's tokens
+    token_version = models.PositiveIntegerField(default=0)
+
+    def revoke_tokens(self):
+        self.token_version = models.F('token_version') + 1
+        self.save(update_fields=['token_version'])
+        self.refresh_from_db(fields=['token_version'])
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        if self.pk is not None:
+            # tokens issued with the old password stop working once this is saved
+            self.token_version += 1
 
 class Profile(models.Model):
     """
@@ -18,14 +36,21 @@ class Profile(models.Model):
         ('cm', 'Centimeters'),
         ('ft', 'Feet'),
     ]
+    ACTIVITY_LEVEL_MULTIPLIERS = {
+        'Sedentary': 1.2,
+        'Lightly Active': 1.375,
+        'Moderately Active': 1.55,
+        'Very Active': 1.725,
+        'Extra Active': 1.9
+    }
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     gender = models.CharField(max_length=10, choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')])
     weight_unit = models.CharField(max_length=3, choices=WEIGHT_UNITS, default='kg')
     height_unit = models.CharField(max_length=3, choices=HEIGHT_UNITS, default='cm')
     height_feet = models.IntegerField(null=True, blank=True)
     height_inches = models.IntegerField(null=True, blank=True)
-    weight = models.CharField(max_length=10)
-    height = models.CharField(max_length=10)
+    weight = models.FloatField() # Always kilograms once saved
+    height = models.FloatField() # Always centimeters once saved
     activity_level = models.CharField(
         max_length=20,
         choices=[
@@ -42,7 +67,49 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination order, see users/pagination.py
+            models.Index(fields=['created_at', 'id'], name='profile_created_id_idx'),
+            # delta sync order, see users/sync.py
+            models.Index(fields=['updated_at', 'id'], name='profile_updated_id_idx'),
+            # filters from users/filters.py: activity level in the default order, activity level with a TDEE range,
+            # gender with an age range, and a TDEE range on its own
+            models.Index(fields=['activity_level', 'created_at', 'id'], name='profile_activity_created_idx'),
+            models.Index(fields=['activity_level', 'TDEE'], name='profile_activity_tdee_idx'),
+            models.Index(fields=['gender', 'age'], name='profile_gender_age_idx'),
+            models.Index(fields=['TDEE'], name='profile_tdee_idx'),
+        ]
+
+    # stats entries (users/stats.py) as of the last load or save, so a save only applies what changed
+    _stats_entries = None
+    STATS_FIELDS = ('activity_level', 'gender', 'age', 'TDEE', 'body_fat')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields().intersection(cls.STATS_FIELDS):
+            instance._stats_entries = stats.profile_entries(instance)
+        return instance
+
     def save(self, *args, **kwargs):
+        self.normalize_measurements()
+        if self._state.adding:
+            previous = []
+        elif self._stats_entries is not None:
+            previous = self._stats_entries
+        else:
+            stored = Profile.objects.filter(pk=self.pk).values(*self.STATS_FIELDS).first()
+            previous = stats.profile_entries(Profile(**stored)) if stored else []
+        current = stats.profile_entries(self)
+        # no savepoint when the caller already has a transaction open
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            ProfileStatsBucket.objects.apply(previous, current)
+        self._stats_entries = current
+
+    def normalize_measurements(self):
+        # bulk_create skips save(), so the bulk paths call this directly before inserting
 
         # Update height and weight units first
         self.height_unit = self.height_unit or 'cm'
@@ -50,8 +117,8 @@ class Profile(models.Model):
         
         # Convert weight to kilograms if not already
         if self.weight_unit == 'lb':
-            pounds = float(str(self.weight).replace('lb', ''))
-            self.weight = str(pounds * 0.45359237)  # Convert pounds to kilograms
+            pounds = float(self.weight)
+            self.weight = pounds * 0.45359237  # Convert pounds to kilograms
             self.weight_unit = 'kg'  # Update weight unit in memory
 
         # Convert height to centimeters if not already
@@ -59,25 +126,14 @@ class Profile(models.Model):
             feet = self.height_feet or 0
             inches = self.height_inches or 0
             total_height_in_inches = feet * 12 + inches
-            self.height = str(total_height_in_inches * 2.54)  # Convert inches to centimeters
+            self.height = total_height_in_inches * 2.54  # Convert inches to centimeters
             self.height_unit = 'cm'  # Update height unit in memory
 
         # Calculate TDEE here based on the user's input
         self.TDEE = self.calculate_tdee()
 
-        super().save(*args, **kwargs)
-
-    def calculate_tdee(self):
-        # Define activity level multipliers
-        activity_levels = {
-            'Sedentary': 1.2,
-            'Lightly Active': 1.375,
-            'Moderately Active': 1.55,
-            'Very Active': 1.725,
-            'Extra Active': 1.9
-        }
-
-        # Convert weight and height to floats
+    def calculate_bmr(self):
+        # Weight and height are numeric columns, float() only matters for unsaved instances built from raw input
         weight = float(self.weight)
         height = float(self.height) 
 
@@ -87,13 +143,121 @@ class Profile(models.Model):
         else:
             bmr = 10 * weight + 6.25 * height - 5 * self.age - 161
 
+        return bmr
+
+    def calculate_tdee(self):
+        # Activity level multipliers are shared with the batch engine in users/tdee.py
+        activity_levels = self.ACTIVITY_LEVEL_MULTIPLIERS
+
         # Calculate TDEE
         activity_level_multiplier = activity_levels[self.activity_level]
-        TDEE = bmr * activity_level_multiplier
+        TDEE = self.calculate_bmr() * activity_level_multiplier
 
         return TDEE
      
         
 
     def __str__(self):  
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+
+class ProfileStatsBucketManager(models.Manager):
+    # backends whose INSERT takes ON CONFLICT ... DO UPDATE, the rest get an INSERT then an UPDATE
+    upsert_vendors = ('sqlite', 'postgresql')
+    # buckets per statement, each one adds 7 parameters to an upsert and 15 to an UPDATE
+    batch_size = 50
+
+    def apply(self, removed, added):
+        """
+        Adds the difference between two lists of stats entries (users/stats.py) to the buckets, creating the ones that
+        don't exist yet: one upsert per 50 buckets. Runs in the caller's transaction, without a savepoint.
+        """
+        change = stats.deltas(removed, added)
+        if not change:
+            return
+        db = router.db_for_write(self.model)
+        keys = list(change)
+        with transaction.atomic(using=db, savepoint=False):
+            for offset in range(0, len(keys), self.batch_size):
+                batch = {key: change[key] for key in keys[offset:offset + self.batch_size]}
+                if connections[db].vendor in self.upsert_vendors:
+                    self.upsert(db, batch)
+                else:
+                    self.create_and_increment(db, batch)
+
+    def upsert(self, db, change):
+        # raw SQL: compiling the equivalent ORM UPDATE costs more than the statement itself
+        connection = connections[db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        keys = [quote(self.model._meta.get_field(name).column) for name in ProfileStatsBucket.KEY_FIELDS]
+        count, total = quote('count'), quote('total')
+        row = '(%s)' % ', '.join(['%s'] * (len(keys) + 2))
+        sql = (
+            f'INSERT INTO {table} ({", ".join(keys)}, {count}, {total}) VALUES {", ".join([row] * len(change))} '
+            f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET '
+            f'{count} = {table}.{count} + excluded.{count}, {total} = {table}.{total} + excluded.{total}'
+        )
+        params = [value for key, delta in change.items() for value in (*key, *delta)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def create_and_increment(self, db, change):
+        # empty buckets first, ones that exist already are skipped, so the UPDATE finds them all
+        self.using(db).bulk_create(
+            [self.model(**dict(zip(ProfileStatsBucket.KEY_FIELDS, key))) for key in change], ignore_conflicts=True,
+        )
+        conditions = [
+            (models.Q(**dict(zip(ProfileStatsBucket.KEY_FIELDS, key))), delta) for key, delta in change.items()
+        ]
+        matches = functools.reduce(operator.or_, (condition for condition, _ in conditions))
+        self.using(db).filter(matches).update(
+            count=models.F('count') + models.Case(
+                *(models.When(condition, then=models.Value(count)) for condition, (count, _) in conditions),
+                default=models.Value(0),
+            ),
+            total=models.F('total') + models.Case(
+                *(models.When(condition, then=models.Value(total)) for condition, (_, total) in conditions),
+                default=models.Value(0.0), output_field=models.FloatField(),
+            ),
+        )
+
+
+class ProfileStatsBucket(models.Model):
+    """
+    One histogram bin of a metric for one (activity level, gender, age bucket) group, kept up to date with deltas from
+    Profile.save and deletes. See users/stats.py. Rebuilt and checked by manage.py rebuild_profile_stats.
+    """
+    KEY_FIELDS = ('metric', 'activity_level', 'gender', 'age_bucket', 'bin')
+
+    metric = models.CharField(max_length=20, choices=[(metric, metric) for metric in stats.BIN_WIDTHS])
+    activity_level = models.CharField(max_length=20)
+    gender = models.CharField(max_length=10)
+    age_bucket = models.IntegerField()
+    bin = models.IntegerField()
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0)
+
+    objects = ProfileStatsBucketManager()
+
+    class Meta:
+        constraints = [
+            # metric first, /profiles/stats/ always reads one metric
+            models.UniqueConstraint(
+                fields=['metric', 'activity_level', 'gender', 'age_bucket', 'bin'], name='profile_stats_bucket_key'
+            ),
+        ]
+
+
+class ProfileTombstone(models.Model):
+    """
+    A deleted profile, written by the post_delete signal so /profiles/changes/ can tell clients about it (see
+    users/sync.py). Pruned by manage.py prune_profile_tombstones.
+    """
+    profile_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_id_idx'),
+        ]
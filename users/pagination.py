@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProfileCursorPagination(CursorPagination):
+    """
+    Keyset pagination for /profiles/. Pages are read straight off the (created_at, id) index with an opaque cursor
+    instead of COUNT(*) plus an OFFSET scan, so a page deep in the table costs the same as the first one.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -2,11 +2,15 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Profile
 from django.contrib.auth.password_validation import validate_password
+from django.core import signing
 import re
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Profile
 from .models import CustomUser
+from .bulk import bulk_save_profiles
+from . import stats, sync
+from drf_api.instrumentation import TimedSerializerMixin, timer
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -16,13 +20,35 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
+        instance = self.build(validated_data)
+        instance.save()
+        return instance
+
+    def build(self, validated_data):
+        # Unsaved user with the password already hashed, so bulk paths can insert it themselves
         password = validated_data.pop('password', None)
         instance = self.Meta.model(**validated_data)
         if password is not None:
-            instance.set_password(password)
-        instance.save()
+            with timer('hash'):
+                instance.set_password(password)
         return instance
-class ProfileSerializer(serializers.ModelSerializer):
+
+
+class BulkProfileListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    used when ProfileSerializer is called with many=True. Instead of one insert (and a second save for body fat) per member,
+    all the users go in with one bulk_create and all the profiles with another, inside a single transaction.
+    """
+    def create(self, validated_data):
+        users = []
+        profiles = []
+        for item in validated_data:
+            user, profile = self.child.build(item)
+            users.append(user)
+            profiles.append(profile)
+        return bulk_save_profiles(users, profiles)
+
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     this and the user serializer above will work together to make sure the profile is validated, has no duplicates, body fat if not know is calucalted along with of course a TDEE.
     With the methods in the model and the validate and create methods, what I'm attempting to do is create a user profile with a tdee, use the measurments the user prefers(and convert them for easier math) and change the input display based on selection
@@ -30,16 +56,18 @@ class ProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer()
     age = serializers.IntegerField()
     activity_level = serializers.ChoiceField(choices=Profile._meta.get_field('activity_level').choices)
-    weight = serializers.CharField(
+    weight = serializers.FloatField(
+        min_value=0,
         error_messages={
             'invalid': "Please enter a valid weight.",
             'required': "Weight is required."
         }
     )
-    height = serializers.CharField(
+    height = serializers.FloatField(
         required=False,
+        min_value=0,
         error_messages={
-            'invalid': "Please enter a valid height in the format '5'9\"'.",
+            'invalid': "Please enter a valid height.",
             'required': "Height is required."
         }
     )
@@ -57,6 +85,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         fields = ('user', 'gender','weight_unit', 'height_unit', 'weight', 'height', 'activity_level', 'body_fat', 'do_not_know_body_fat', 'waist_measurement', 'hip_measurement', 'TDEE', 'created_at', 'updated_at', 'age', 'height_feet', 'height_inches')
         read_only_fields = ('do_not_know_body_fat','created_at', 'updated_at', 'TDEE')
         depth = 1
+        list_serializer_class = BulkProfileListSerializer
 
 
     def validate(self, data):
@@ -72,23 +101,22 @@ class ProfileSerializer(serializers.ModelSerializer):
             data['body_fat'] = body_fat
 
         # New validation for weight and height based on the selected unit
-        weight = data.get('weight')
         height = data.get('height')
         height_feet = data.get('height_feet')
         height_inches = data.get('height_inches')
         height_unit = data.get('height_unit')
 
-        if not weight.isdigit():
-            raise serializers.ValidationError("Weight must be a numeric value.")
+        # weight and height are FloatFields, so anything non-numeric was already rejected
         if height_unit == 'ft' and (height_feet is None or height_inches is None):
             raise serializers.ValidationError("Both feet and inches must be provided when the unit is 'ft'.")
-        if height_unit != 'ft' and not height:
+        # a partial update can leave the stored height alone
+        if height_unit != 'ft' and not height and not (self.partial and 'height' not in data):
             raise serializers.ValidationError("Height is required when the unit is not 'ft'.")
         
         # Convert height to centimeters if necessary
         if height_unit == 'ft':
             total_height_in_inches = height_feet * 12 + height_inches
-            data['height'] = str(total_height_in_inches * 2.54)  # Convert inches to centimeters
+            data['height'] = total_height_in_inches * 2.54  # Convert inches to centimeters
             data['height_unit'] = 'cm'  # Update height unit in memory
 
         return data
@@ -101,50 +129,159 @@ class ProfileSerializer(serializers.ModelSerializer):
 
    
     def create(self, validated_data):
+        user, profile = self.build(validated_data)
+        user.save()
+        profile.user = user
+        profile.save()  # This will call the `save` method of your `Profile` model
+        return profile
+
+    def build(self, validated_data):
         # Extract 'do_not_know_body_fat', 'waist_measurement', and 'hip_measurement' from the data
         do_not_know_body_fat = validated_data.pop('do_not_know_body_fat', False)
         waist_measurement = validated_data.pop('waist_measurement', None)
         hip_measurement = validated_data.pop('hip_measurement', None)
-            
-        # Extract 'user' data for creating the User instance
+
+        # Extract 'user' data for building the User instance
         user_data = validated_data.pop('user')
-        user = UserSerializer.create(UserSerializer(), validated_data=user_data)
-        
-        # Create the Profile instance without 'do_not_know_body_fat', 'waist_measurement', 'hip_measurement', and 'user'
-        profile = Profile(user=user, **validated_data)
-        profile.save()  # This will call the `save` method of your `Profile` model
-        
+        user = UserSerializer().build(user_data)
+
+        # Build the Profile instance without 'do_not_know_body_fat', 'waist_measurement', 'hip_measurement', and 'user'
+        profile = Profile(**validated_data)
+
         # If 'do_not_know_body_fat' is False and both waist and hip measurements are provided, calculate body fat
+        # before the first save so the profile is written once
         if not do_not_know_body_fat and waist_measurement is not None and hip_measurement is not None:
-            # Calculate body fat using the provided measurements
-            body_fat = self.calculate_body_fat(waist_measurement, hip_measurement)
-            # Update the 'body_fat' field of the Profile instance
-            profile.body_fat = body_fat
-            profile.save()
-        
-        return profile
-    
+            profile.body_fat = self.calculate_body_fat(waist_measurement, hip_measurement)
+
+        return user, profile
+
     def update(self, instance, validated_data):
-        # Extract weight and height units
-        weight_unit = validated_data.pop('weight_unit', None)
-        height_unit = validated_data.pop('height_unit', None)
-
-        # Convert weight to kilograms if necessary
-        if weight_unit == 'lb':
-            validated_data['weight'] = validated_data['weight'] * 0.453592
-            validated_data['weight_unit'] = 'kg'
-        else:
-            validated_data['weight'] = instance.weight
-
-        # Convert height to meters if necessary
-        if height_unit == 'ft':
-            validated_data['height'] = validated_data['height'] * 0.3048
-            validated_data['height_unit'] = 'm'
-        else:
-            validated_data['height'] = instance.height
+        # These only matter when the profile is created
+        validated_data.pop('do_not_know_body_fat', None)
+        validated_data.pop('waist_measurement', None)
+        validated_data.pop('hip_measurement', None)
+        # The account is never changed from here, email and password go through the authenticated auth views
+        validated_data.pop('user', None)
+
+        # The stored weight is always kg, so a unit on its own would convert the old value a second time.
+        # Height in feet was already converted to cm by validate().
+        if 'weight' not in validated_data:
+            validated_data.pop('weight_unit', None)
 
-        # Update the profile instance
+        # Update the profile instance, Profile.save converts pounds to kilograms and recalculates the TDEE
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         return instance
+
+
+class ProfileReadListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class ProfileReadSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    read-only twin of ProfileSerializer for list and retrieve. It takes the dicts from .values(*columns()) and runs only
+    the to_representation of each field ProfileSerializer outputs, so the response is the same without building the nested
+    serializer, its validators and the write-only fields for every row.
+    fields= limits the output to those keys (see sparse fieldsets in ProfileViewSet), columns(fields) loads only what they need.
+    """
+    _plan = None
+
+    class Meta:
+        list_serializer_class = ProfileReadListSerializer
+
+    @classmethod
+    def plan(cls):
+        # [(key, column, to_representation)], the nested user as (key, None, [its own entries]), in output order
+        if cls._plan is None:
+            stored = {field.attname for field in Profile._meta.concrete_fields}
+            plan = []
+            for name, field in ProfileSerializer().fields.items():
+                if field.write_only:
+                    continue
+                if name == 'user':
+                    plan.append((name, None, [
+                        (child_name, f'user__{child.source}', child.to_representation)
+                        for child_name, child in field.fields.items() if not child.write_only
+                    ]))
+                elif field.source in stored:
+                    # declared fields without a column (do_not_know_body_fat...) are never in the output
+                    plan.append((name, field.source, field.to_representation))
+            cls._plan = plan
+        return cls._plan
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entries = self.select(fields)
+
+    @classmethod
+    def field_names(cls):
+        return [name for name, _, _ in cls.plan()]
+
+    @classmethod
+    def select(cls, fields=None):
+        return [entry for entry in cls.plan() if fields is None or entry[0] in fields]
+
+    @classmethod
+    def columns(cls, fields=None):
+        # id, updated_at and created_at are needed by cursor pagination and the conditional GET validators. The user
+        # join only happens when a user field is selected.
+        columns = ['id', 'updated_at', 'created_at']
+        for _, column, represent in cls.select(fields):
+            wanted = [column] if column else [child_column for _, child_column, _ in represent]
+            columns += [name for name in wanted if name not in columns]
+        return columns
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, represent in self.entries:
+            if column is None:
+                data[name] = {
+                    child_name: None if row[child_column] is None else child_represent(row[child_column])
+                    for child_name, child_column, child_represent in represent
+                }
+            else:
+                value = row[column]
+                data[name] = None if value is None else represent(value)
+        return data
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    """Query parameters of /profiles/stats/. group_by and percentiles are comma-separated lists."""
+    metric = serializers.ChoiceField(choices=list(stats.BIN_WIDTHS), default='TDEE')
+    group_by = serializers.CharField(default=','.join(stats.GROUP_FIELDS), allow_blank=True)
+    percentiles = serializers.CharField(default='25,50,75,90')
+    activity_level = serializers.ChoiceField(choices=Profile._meta.get_field('activity_level').choices, required=False)
+    gender = serializers.ChoiceField(choices=Profile._meta.get_field('gender').choices, required=False)
+    age_bucket = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_group_by(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in stats.GROUP_FIELDS]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Unknown field(s): {", ".join(unknown)}. Choose from {", ".join(stats.GROUP_FIELDS)}.'
+            )
+        return [field for field in stats.GROUP_FIELDS if field in fields]
+
+    def validate_percentiles(self, value):
+        try:
+            percentiles = [float(item) for item in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError('Expected comma-separated numbers.')
+        if not percentiles or len(percentiles) > 20 or not all(0 < item <= 100 for item in percentiles):
+            raise serializers.ValidationError('Expected up to 20 numbers between 0 and 100.')
+        return percentiles
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Query parameters of /profiles/changes/. since is the watermark from the previous response."""
+    since = serializers.CharField(required=False)
+    limit = serializers.IntegerField(default=500, min_value=1, max_value=1000)
+
+    def validate_since(self, value):
+        try:
+            return sync.read_watermark(value)
+        except signing.BadSignature:
+            raise serializers.ValidationError('Not a watermark issued by this server.')
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics, stats
+from .authentication import version_cache_key
+from .models import CustomUser, Profile, ProfileStatsBucket, ProfileTombstone
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_metrics(sender, instance, **kwargs):
+    # after commit, or a metrics miss in between could cache the old values again until the timeout
+    pk = instance.pk
+    transaction.on_commit(lambda: metrics.invalidate(pk))
+
+
+@receiver(post_delete, sender=Profile)
+def remove_profile_stats(sender, instance, **kwargs):
+    # also runs for profiles deleted along with their user
+    previous = instance._stats_entries
+    ProfileStatsBucket.objects.apply(stats.profile_entries(instance) if previous is None else previous, [])
+
+
+@receiver(post_delete, sender=Profile)
+def record_profile_tombstone(sender, instance, **kwargs):
+    ProfileTombstone.objects.create(profile_id=instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_token_version(sender, instance, **kwargs):
+    # a version bump or deactivation has to reach the next request
+    cache.delete(version_cache_key(instance.pk))
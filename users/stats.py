@@ -0,0 +1,98 @@
+"""
+Population statistics for /profiles/stats/. Every profile adds one histogram entry per metric to
+ProfileStatsBucket, keyed by (metric, activity_level, gender, age_bucket, bin), so the table holds count and total
+per bin and never has to be recomputed from Profile. Saves and deletes apply the difference between a profile's old
+and new entries (ProfileStatsBucket.objects.apply). Means are exact; percentiles are interpolated inside a bin, so
+they are within one bin width of the true value. Queryset .update() and raw SQL skip the summary; run
+manage.py rebuild_profile_stats after them (--check reports drift).
+"""
+import collections
+import math
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Floor
+
+# histogram bin width per metric
+BIN_WIDTHS = {'TDEE': 50.0, 'body_fat': 1.0}
+AGE_BUCKET_YEARS = 10
+GROUP_FIELDS = ('activity_level', 'gender', 'age_bucket')
+
+
+def age_bucket(age):
+    return age // AGE_BUCKET_YEARS * AGE_BUCKET_YEARS
+
+
+def entries(activity_level, gender, age, values):
+    """[(key, value)] for one profile, values maps metric to value (None values are left out)."""
+    bucket = age_bucket(age)
+    return [
+        ((metric, activity_level, gender, bucket, math.floor(value / BIN_WIDTHS[metric])), value)
+        for metric, value in values.items() if value is not None
+    ]
+
+
+def profile_entries(profile):
+    return entries(
+        profile.activity_level, profile.gender, profile.age, {'TDEE': profile.TDEE, 'body_fat': profile.body_fat}
+    )
+
+
+def deltas(removed, added):
+    """{key: [count, total]} that turns the removed entries into the added ones. Keys that don't change are left out."""
+    change = collections.defaultdict(lambda: [0, 0.0])
+    for key, value in removed:
+        change[key][0] -= 1
+        change[key][1] -= value
+    for key, value in added:
+        change[key][0] += 1
+        change[key][1] += value
+    return {key: delta for key, delta in change.items() if delta != [0, 0.0]}
+
+
+def scan(profiles):
+    """
+    {key: [count, total]} for every bucket, computed from a Profile queryset with one GROUP BY per metric. Used to
+    build the table from scratch and to check it.
+    """
+    buckets = {}
+    for metric, width in BIN_WIDTHS.items():
+        rows = (
+            profiles.filter(**{f'{metric}__isnull': False})
+            .annotate(age_bucket=F('age') / AGE_BUCKET_YEARS * AGE_BUCKET_YEARS, bin=Floor(F(metric) / width))
+            .values('activity_level', 'gender', 'age_bucket', 'bin')
+            .annotate(count=Count('pk'), total=Sum(metric))
+            .order_by()
+        )
+        for row in rows:
+            key = (metric, row['activity_level'], row['gender'], int(row['age_bucket']), int(row['bin']))
+            buckets[key] = [row['count'], row['total']]
+    return buckets
+
+
+def summarize(metric, rows, percentiles):
+    """
+    rows are (bin, count, total) for one group. Returns count, mean and the requested percentiles, or None when the
+    group is empty.
+    """
+    histogram = collections.Counter()
+    count = 0
+    total = 0.0
+    for bin_index, bin_count, bin_total in rows:
+        histogram[bin_index] += bin_count
+        count += bin_count
+        total += bin_total
+    if count <= 0:
+        return None
+
+    width = BIN_WIDTHS[metric]
+    bins = sorted((bin_index, bin_count) for bin_index, bin_count in histogram.items() if bin_count > 0)
+    results = {}
+    for percentile in percentiles:
+        rank = percentile / 100 * count
+        seen = 0
+        for bin_index, bin_count in bins:
+            if seen + bin_count >= rank:
+                results[f'p{percentile:g}'] = (bin_index + (rank - seen) / bin_count) * width
+                break
+            seen += bin_count
+    return {'count': count, 'mean': total / count, 'percentiles': results}
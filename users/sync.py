@@ -0,0 +1,92 @@
+"""
+Delta sync for /profiles/changes/. A client keeps the opaque watermark from its last response and sends it back as
+?since=, and gets the profiles created or updated after it plus the ids of the profiles deleted after it.
+
+The watermark is a signed pair of keyset positions: (updated_at, id) in Profile, read off profile_updated_id_idx, and
+(deleted_at, id) in ProfileTombstone, read off tombstone_deleted_id_idx. Each request is two range scans of at most
+`limit` + 1 rows, so the cost follows the number of changes and not the size of the table. Watermarks expire after
+PROFILE_SYNC_WATERMARK_MAX_AGE; the client then downloads everything again, which is what makes pruning older
+tombstones safe.
+
+updated_at and deleted_at are stamped when a transaction starts, not when it commits, so a row can show up with a
+timestamp older than one already handed out. Only rows older than PROFILE_SYNC_SAFETY_LAG are returned, and so a
+watermark never gets closer to now than that. Rows inside the lag wait for a later call. Any write that commits
+within the lag of being stamped is seen, and that includes a recompute_tdee chunk.
+"""
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import Profile, ProfileTombstone
+
+SALT = 'users.sync'
+
+
+class ExpiredWatermark(Exception):
+    pass
+
+
+def issue_watermark(changed, deleted):
+    """changed and deleted are (datetime, id) positions, either can be None for "from the start"."""
+    return signing.dumps(
+        [None if position is None else [position[0].isoformat(), position[1]] for position in (changed, deleted)],
+        salt=SALT,
+    )
+
+
+def read_watermark(token):
+    """
+    The (changed, deleted) positions in a watermark. Raises signing.BadSignature for a token that wasn't issued here and
+    ExpiredWatermark for one that is too old to trust.
+    """
+    try:
+        positions = signing.loads(token, salt=SALT, max_age=settings.PROFILE_SYNC_WATERMARK_MAX_AGE)
+    except signing.SignatureExpired:
+        raise ExpiredWatermark()
+    return tuple(
+        None if position is None else (datetime.datetime.fromisoformat(position[0]), position[1])
+        for position in positions
+    )
+
+
+def after(queryset, field, position):
+    if position is None:
+        return queryset
+    value, pk = position
+    # a range on the index plus a filter for the rows that share the watermark's timestamp
+    return queryset.filter(**{f'{field}__gte': value}).exclude(**{field: value, 'id__lte': pk})
+
+
+def latest_tombstone(cutoff):
+    return (
+        ProfileTombstone.objects.filter(deleted_at__lt=cutoff).order_by('-deleted_at', '-id')
+        .values_list('deleted_at', 'id').first()
+    )
+
+
+def changes(since, limit, columns):
+    """
+    Returns (changed rows, deleted profile ids, next watermark, more). Without since, every profile is a change and
+    tombstones start at the newest one before the lag, a client with no copy has nothing to delete.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.PROFILE_SYNC_SAFETY_LAG)
+    changed_after, deleted_after = since or (None, latest_tombstone(cutoff))
+    rows = list(
+        after(Profile.objects.filter(updated_at__lt=cutoff).values(*columns), 'updated_at', changed_after)
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    tombstones = list(
+        after(ProfileTombstone.objects.filter(deleted_at__lt=cutoff), 'deleted_at', deleted_after)
+        .order_by('deleted_at', 'id').values_list('deleted_at', 'id', 'profile_id')[:limit + 1]
+    )
+    more = len(rows) > limit or len(tombstones) > limit
+    rows = rows[:limit]
+    tombstones = tombstones[:limit]
+
+    if rows:
+        changed_after = (rows[-1]['updated_at'], rows[-1]['id'])
+    if tombstones:
+        deleted_after = tombstones[-1][:2]
+    return rows, [profile_id for _, _, profile_id in tombstones], issue_watermark(changed_after, deleted_after), more
@@ -0,0 +1,88 @@
+"""
+Batch version of Profile.calculate_tdee. Profiles are loaded a chunk at a time as columns, BMR and TDEE are computed
+with NumPy for the whole chunk, and only the rows whose TDEE actually changed are written back with bulk_update
+(TDEE and updated_at, nothing else).
+The arithmetic is done in the same order as calculate_tdee so the results are bit for bit the same.
+"""
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, stats
+from .models import Profile, ProfileStatsBucket
+
+COLUMNS = ('pk', 'weight', 'height', 'age', 'gender', 'activity_level', 'TDEE')
+
+
+def calculate_bmr(weight, height, age, gender):
+    """Mifflin-St Jeor BMR for arrays of kg, cm, years and 'M'/'F'/'O' gender codes."""
+    male = np.asarray(gender) == 'M'
+    return 10 * weight + 6.25 * height - 5 * age + np.where(male, 5.0, -161.0)
+
+
+def activity_multipliers(activity_level):
+    multipliers = Profile.ACTIVITY_LEVEL_MULTIPLIERS
+    return np.fromiter((multipliers[level] for level in activity_level), dtype=np.float64, count=len(activity_level))
+
+
+def calculate_tdee(weight, height, age, gender, activity_level):
+    return calculate_bmr(weight, height, age, gender) * activity_multipliers(activity_level)
+
+
+def chunk_bounds(chunk_size, queryset=None):
+    """
+    Splits the profiles into (first_pk, last_pk) ranges of at most chunk_size rows, walking the primary key index.
+    """
+    queryset = (Profile.objects.all() if queryset is None else queryset).order_by('pk').values_list('pk', flat=True)
+    bounds = []
+    first = queryset.first()
+    while first is not None:
+        following = list(queryset.filter(pk__gte=first)[chunk_size - 1:chunk_size + 1])
+        if not following:
+            last = queryset.filter(pk__gte=first).last()
+            bounds.append((first, last))
+            break
+        bounds.append((first, following[0]))
+        first = following[1] if len(following) > 1 else None
+    return bounds
+
+
+def recompute_chunk(bounds):
+    """
+    Recomputes TDEE for the profiles with first_pk <= pk <= last_pk. Returns (rows_read, rows_updated).
+    """
+    first_pk, last_pk = bounds
+    rows = list(Profile.objects.filter(pk__gte=first_pk, pk__lte=last_pk).values_list(*COLUMNS))
+    if not rows:
+        return 0, 0
+    pks, weight, height, age, gender, activity_level, stored = zip(*rows)
+
+    tdee = calculate_tdee(
+        np.asarray(weight, dtype=np.float64),
+        np.asarray(height, dtype=np.float64),
+        np.asarray(age, dtype=np.float64),
+        gender,
+        activity_level,
+    )
+    # NaN for missing values, so profiles that never got a TDEE count as changed
+    changed = np.flatnonzero(tdee != np.asarray(stored, dtype=np.float64))
+
+    # updated_at is bumped by hand (bulk_update skips auto_now) so ETags and other updated_at readers see the change
+    now = timezone.now()
+    removed = []
+    added = []
+    for index in changed:
+        group = (activity_level[index], gender[index], age[index])
+        removed += stats.entries(*group, {'TDEE': stored[index]})
+        added += stats.entries(*group, {'TDEE': float(tdee[index])})
+    with transaction.atomic():
+        Profile.objects.bulk_update(
+            [Profile(pk=pks[index], TDEE=float(tdee[index]), updated_at=now) for index in changed],
+            ['TDEE', 'updated_at'],
+            batch_size=1000,
+        )
+        # and no save(), so the population stats get the TDEE changes here
+        ProfileStatsBucket.objects.apply(removed, added)
+    # bulk_update sends no post_save, so drop the cached metrics here
+    metrics.invalidate(*(pks[index] for index in changed))
+    return len(rows), len(changed)
@@ -1,6 +1,37 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
-from .models import Profile
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from benchmarks.startup import measure as measure_startup
+from django.conf import settings
+from django.contrib.auth.forms import SetPasswordForm
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, models
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Avg
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from drf_api import instrumentation, profiling
+from drf_api.db_routers import ReplicaRouter, use_replica
+from . import hashing, importer, metrics, stats
+from .authentication import (
+    StatelessJWTCookieAuthentication, VersionedTokenObtainPairSerializer, current_token_version,
+)
+from .models import CustomUser, Profile, ProfileStatsBucket, ProfileStatsBucketManager, ProfileTombstone
+from .serializers import ProfileReadSerializer, ProfileSerializer
 
 class ProfileTestCase(TestCase):
     """
@@ -82,4 +113,1192 @@ class ProfileTestCase(TestCase):
         profile = Profile.objects.get()
         expected_bmr = (10 * 70) + (6.25 * 170) - (5 * 25) + 5  # Mifflin-St Jeor Equation for men
         expected_tdee = expected_bmr * 1.2  # Sedentary activity level
-        self.assertAlmostEqual(profile.TDEE, expected_tdee, places=3)
\ No newline at end of file
+        self.assertAlmostEqual(profile.TDEE, expected_tdee, places=3)
+
+class BulkProfileTestCase(TestCase):
+    """
+    the bulk endpoint should write a whole batch at once, point at the exact items that failed, and only write the good ones when asked to."""
+    def setUp(self):
+        self.client = APIClient()
+
+    def profile_payload(self, index, **overrides):
+        payload = {
+            'user': {
+                'username': f'member{index}',
+                'email': f'member{index}@example.com',
+                'password': 'testpassword'
+            },
+            'gender': 'F',
+            'weight_unit': 'kg',
+            'height_unit': 'cm',
+            'weight': '60',
+            'height': '165',
+            'activity_level': 'Lightly Active',
+            'age': 28
+        }
+        payload.update(overrides)
+        return payload
+
+    def test_bulk_create_profiles(self):
+        payloads = [self.profile_payload(i) for i in range(5)]
+        payloads[0].update({'waist_measurement': 80.0, 'hip_measurement': 60.0})
+        payloads[1].update({'weight_unit': 'lb', 'weight': '132'})
+        response = self.client.post('/profiles/bulk/', payloads, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 5)
+        self.assertEqual(Profile.objects.count(), 5)
+        self.assertAlmostEqual(Profile.objects.get(user__username='member0').body_fat, 25.0)
+        single = Profile(gender='F', weight=132, weight_unit='lb', height=165, activity_level='Lightly Active', age=28)
+        single.normalize_measurements()
+        self.assertEqual(Profile.objects.get(user__username='member1').TDEE, single.TDEE)
+        self.assertTrue(Profile.objects.get(user__username='member2').user.check_password('testpassword'))
+
+    def test_bulk_create_rejects_whole_batch_on_error(self):
+        payloads = [self.profile_payload(i) for i in range(3)]
+        payloads[1]['weight'] = 'heavy'
+        payloads[2]['user']['username'] = 'member0'
+        response = self.client.post('/profiles/bulk/', payloads, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(Profile.objects.count(), 0)
+
+    def test_bulk_create_partial_success(self):
+        payloads = [self.profile_payload(i) for i in range(3)]
+        payloads[1]['weight'] = 'heavy'
+        response = self.client.post('/profiles/bulk/?partial_success=true', payloads, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertEqual(Profile.objects.count(), 2)
+
+
+class RecomputeTDEETestCase(TestCase):
+    """
+    the batch engine has to give exactly the same numbers as Profile.calculate_tdee, and the command should only touch rows that changed."""
+    def setUp(self):
+        levels = list(Profile.ACTIVITY_LEVEL_MULTIPLIERS)
+        for index in range(7):
+            user = CustomUser.objects.create(username=f'member{index}', email=f'member{index}@example.com')
+            Profile.objects.create(
+                user=user,
+                gender='MFO'[index % 3],
+                weight=50.5 + index * 7.3,
+                height=150 + index * 4.1,
+                activity_level=levels[index % len(levels)],
+                age=18 + index * 6,
+            )
+
+    def test_engine_matches_calculate_tdee(self):
+        Profile.objects.update(TDEE=None)
+        out = StringIO()
+        call_command('recompute_tdee', chunk_size=3, stdout=out)
+        self.assertIn('7 profiles (7 changed)', out.getvalue())
+        for profile in Profile.objects.all():
+            self.assertEqual(profile.TDEE, profile.calculate_tdee())
+
+    def test_unchanged_rows_are_not_written(self):
+        out = StringIO()
+        call_command('recompute_tdee', chunk_size=100, stdout=out)
+        self.assertIn('7 profiles (0 changed)', out.getvalue())
+
+
+class NumericMeasurementsTestCase(TestCase):
+    """
+    weight and height are stored as numbers in kg and cm, so the database can filter and aggregate them, and updates convert units the same way creates do."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profile_data = {
+            'user': {
+                'username': 'testuser',
+                'email': 'testuser@example.com',
+                'password': 'testpassword'
+            },
+            'gender': 'F',
+            'weight_unit': 'kg',
+            'height_unit': 'cm',
+            'weight': '62.5',
+            'height': '168.5',
+            'activity_level': 'Very Active',
+            'age': 35
+        }
+
+    def test_decimal_measurements_are_stored_as_numbers(self):
+        response = self.client.post('/profiles/', self.profile_data, format='json')
+        self.assertEqual(response.status_code, 201)
+        profile = Profile.objects.get()
+        self.assertEqual(profile.weight, 62.5)
+        self.assertEqual(profile.height, 168.5)
+        self.assertEqual(Profile.objects.filter(weight__range=(60, 65)).count(), 1)
+        self.assertEqual(Profile.objects.aggregate(Avg('height'))['height__avg'], 168.5)
+
+    def test_non_numeric_weight_is_rejected(self):
+        self.profile_data['weight'] = '62kg'
+        response = self.client.post('/profiles/', self.profile_data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weight', response.data)
+
+    def test_partial_update_in_pounds_recalculates_tdee(self):
+        self.client.post('/profiles/', self.profile_data, format='json')
+        profile = Profile.objects.get()
+        response = self.client.patch(f'/profiles/{profile.pk}/', {'weight': 150, 'weight_unit': 'lb'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        profile.refresh_from_db()
+        self.assertAlmostEqual(profile.weight, 150 * 0.45359237)
+        self.assertEqual(profile.weight_unit, 'kg')
+        self.assertEqual(profile.height, 168.5)
+        self.assertEqual(profile.TDEE, profile.calculate_tdee())
+
+    def test_update_leaves_the_account_alone(self):
+        self.client.post('/profiles/', self.profile_data, format='json')
+        profile = Profile.objects.get()
+        response = self.client.patch(f'/profiles/{profile.pk}/', {
+            'age': 31, 'user': {'email': 'taken@example.com', 'password': 'anotherpassword1'},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        user = CustomUser.objects.get()
+        self.assertEqual(user.email, 'testuser@example.com')
+        self.assertTrue(user.check_password('testpassword'))
+        self.assertEqual(Profile.objects.get().age, 31)
+
+
+class NumericMeasurementsMigrationTestCase(TransactionTestCase):
+    """
+    migration 0005 reads legacy heights in the unit they were stored with ('m' was only a default, so mostly cm), and
+    stops on a height that doesn't fit its unit."""
+    before = [('users', '0004_profile_height_feet_profile_height_inches')]
+    after = [('users', '0005_profile_numeric_weight_height')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def legacy_profile(self, index, height, height_unit):
+        apps = self.executor.loader.project_state(self.before).apps
+        user = apps.get_model('users', 'CustomUser').objects.create(
+            username=f'legacy{index}', email=f'legacy{index}@example.com'
+        )
+        return apps.get_model('users', 'Profile').objects.create(
+            user=user, gender='M', weight='70', weight_unit='kg', height=height, height_unit=height_unit,
+            activity_level='Sedentary', age=30,
+        ).pk
+
+    def test_legacy_units_are_converted(self):
+        pks = {
+            self.legacy_profile(0, '1.75', 'm'): 175.0,
+            self.legacy_profile(4, '183.0', 'm'): 183.0,
+            self.legacy_profile(1, '69', 'in'): 69 * 2.54,
+            self.legacy_profile(2, '5\'9"', 'in'): 69 * 2.54,
+            self.legacy_profile(3, '175', 'cm'): 175.0,
+        }
+        self.executor.migrate(self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        for pk, height, unit in apps.get_model('users', 'Profile').objects.values_list('pk', 'height', 'height_unit'):
+            self.assertAlmostEqual(height, pks[pk])
+            self.assertEqual(unit, 'cm')
+
+    def test_height_that_does_not_fit_its_unit_stops_the_migration(self):
+        pk = self.legacy_profile(0, '5.9', 'm')
+        with self.assertRaisesRegex(ValueError, f'Profile {pk} '):
+            self.executor.migrate(self.after)
+        # so tearDown can migrate forward again
+        self.executor.loader.project_state(self.before).apps.get_model('users', 'Profile').objects.filter(pk=pk).delete()
+
+
+def make_profile(index, **fields):
+    user = CustomUser.objects.create(username=f'member{index}', email=f'member{index}@example.com')
+    values = {
+        'gender': 'M',
+        'weight': 70 + index % 20,
+        'height': 170 + index % 15,
+        'activity_level': 'Sedentary',
+        'age': 20 + index % 40,
+    }
+    values.update(fields)
+    return Profile.objects.create(user=user, **values)
+
+
+class ProfileQueryCountTestCase(TestCase):
+    """
+    listing and retrieving profiles has a fixed query budget, however many rows are on the page. A new field that needs its own query will fail these."""
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_list_query_count_does_not_grow_with_page(self):
+        for index in range(2):
+            make_profile(index)
+        with self.assertNumQueries(1):  # one joined SELECT, cursor pages don't COUNT
+            response = self.client.get('/profiles/')
+        self.assertEqual(len(response.data['results']), 2)
+
+        for index in range(2, 15):
+            make_profile(index)
+        with self.assertNumQueries(1):
+            response = self.client.get('/profiles/')
+        self.assertEqual(len(response.data['results']), 10)
+        with self.assertNumQueries(1):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][-1]['user'], {'username': 'member0', 'email': 'member0@example.com'})
+
+    def test_retrieve_is_a_single_query(self):
+        profile = make_profile(0)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/profiles/{profile.pk}/')
+        self.assertEqual(response.data['user']['username'], 'member0')
+
+
+class ProfilePaginationTestCase(TestCase):
+    """
+    /profiles/ pages through a keyset cursor, newest first, without a total count."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profiles = [make_profile(index) for index in range(7)]
+
+    def test_cursor_walks_every_profile_once(self):
+        seen = []
+        url = '/profiles/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['user']['username'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [f'member{index}' for index in reversed(range(7))])
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get('/profiles/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTestCase(TestCase):
+    """
+    unchanged profiles come back as 304 without building the body, a changed profile invalidates the validators."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profile = make_profile(0)
+
+    def test_retrieve_not_modified(self):
+        url = f'/profiles/{self.profile.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.profile.age += 1
+        self.profile.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_retrieve_if_modified_since(self):
+        url = f'/profiles/{self.profile.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_not_modified_until_a_profile_changes(self):
+        make_profile(1)
+        etag = self.client.get('/profiles/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/profiles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.assertNotEqual(self.client.get('/profiles/?page_size=1')['ETag'], etag)
+        self.profile.delete()
+        self.assertEqual(self.client.get('/profiles/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unknown_profile_is_still_404(self):
+        self.assertEqual(self.client.get('/profiles/999/', HTTP_IF_NONE_MATCH='W/"x"').status_code, 404)
+        self.assertEqual(self.client.get('/profiles/abc/', HTTP_IF_NONE_MATCH='W/"x"').status_code, 404)
+
+
+class ProfileMetricsTestCase(TestCase):
+    """
+    derived metrics are served from the cache after the first request, and saving or deleting the profile throws the cached copy away."""
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.profile = make_profile(0, body_fat=20.0)
+        self.url = f'/profiles/{self.profile.pk}/metrics/'
+
+    def test_metrics_are_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tdee'], self.profile.calculate_tdee())
+        self.assertEqual(response.data['calorie_targets']['lose'], self.profile.calculate_tdee() - 500)
+        self.assertAlmostEqual(response.data['lean_mass'], self.profile.weight * 0.8)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data, response.data)
+        self.assertEqual(self.client.get('/profiles/metrics/stats/').data, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_save_and_delete_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.weight += 10
+            self.profile.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['tdee'], self.profile.calculate_tdee())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_invalidation_waits_for_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.profile.save()
+            self.assertIsNotNone(metrics.get_cached(self.profile.pk))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(metrics.get_cached(self.profile.pk))
+
+    def test_warm_active_users(self):
+        CustomUser.objects.filter(pk=self.profile.user_id).update(last_login=timezone.now())
+        make_profile(1)  # never logged in
+        call_command('warm_profile_metrics', stdout=StringIO())
+        self.assertIsNotNone(metrics.get_cached(self.profile.pk))
+        self.assertIsNone(metrics.get_cached(self.profile.pk + 1))
+
+
+class ProfileExportTestCase(TestCase):
+    """
+    the export streams one line per profile, oldest change first, and --state/since only pick up what changed."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profiles = [make_profile(index) for index in range(3)]
+
+    def test_export_requires_staff(self):
+        self.assertEqual(self.client.get('/profiles/export/').status_code, 403)
+
+    def test_streams_ndjson_and_csv(self):
+        staff = CustomUser.objects.create(username='analyst', email='analyst@example.com', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get('/profiles/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['member0', 'member1', 'member2'])
+        self.assertEqual(rows[0]['TDEE'], self.profiles[0].TDEE)
+
+        response = self.client.get('/profiles/export/', {'output': 'csv', 'since': self.profiles[2].updated_at.isoformat()})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'username', 'email'])
+        self.assertEqual(len(lines), 2)
+
+    def test_incremental_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state = os.path.join(directory, 'watermark')
+            out = StringIO()
+            call_command('export_profiles', state=state, stdout=out, stderr=StringIO())
+            self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+            self.profiles[0].age += 1
+            self.profiles[0].save()
+            out = StringIO()
+            call_command('export_profiles', state=state, stdout=out, stderr=StringIO())
+            # the watermark row itself is included again, then the profile changed since
+            self.assertEqual(
+                [json.loads(line)['username'] for line in out.getvalue().splitlines()], ['member2', 'member0']
+            )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportProfilesTestCase(TestCase):
+    """
+    the import writes good rows, sends bad and clashing ones to the rejects file, and picks up after its checkpoint."""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory.name, 'members.csv')
+        with open(path, 'w', newline='') as source:
+            writer = csv.DictWriter(source, fieldnames=['username', 'email', 'password', 'gender', 'weight_unit', 'height_unit', 'weight', 'height', 'activity_level', 'age'])
+            writer.writeheader()
+            for index, row in enumerate(rows):
+                values = {
+                    'username': f'member{index}', 'email': f'member{index}@example.com', 'password': 'importpassword',
+                    'gender': 'M', 'weight_unit': 'kg', 'height_unit': 'cm', 'weight': '80', 'height': '180',
+                    'activity_level': 'Sedentary', 'age': '40',
+                }
+                values.update(row)
+                writer.writerow(values)
+        return path
+
+    def test_import_with_rejects(self):
+        path = self.write_csv([{}, {'weight': 'heavy'}, {}, {'username': 'member0', 'email': 'other@example.com'}, {}])
+        # one batch, so the repeated username only shows up when the batch is written
+        call_command('import_profiles', path, workers=1, batch_size=10, stdout=StringIO())
+        self.assertEqual(
+            sorted(Profile.objects.values_list('user__username', flat=True)), ['member0', 'member2', 'member4']
+        )
+        self.assertTrue(CustomUser.objects.get(username='member2').check_password('importpassword'))
+        with open(f'{path}.rejects.ndjson') as rejects:
+            rejected = [json.loads(line) for line in rejects]
+        self.assertEqual([reject['row'] for reject in rejected], [2, 4])
+        self.assertIn('weight', rejected[0]['errors'])
+        self.assertNotIn('password', rejected[0]['data'])
+
+    def test_resume_from_checkpoint(self):
+        path = self.write_csv([{}, {}, {}, {}])
+        importer.write_checkpoint(f'{path}.checkpoint', path, 2)
+        out = StringIO()
+        call_command('import_profiles', path, workers=1, batch_size=10, stdout=out)
+        self.assertIn('Resuming after row 2', out.getvalue())
+        self.assertEqual(sorted(Profile.objects.values_list('user__username', flat=True)), ['member2', 'member3'])
+        self.assertEqual(importer.read_checkpoint(f'{path}.checkpoint', path), 4)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncRegistrationTestCase(TestCase):
+    """
+    registering through the async view gives the same profile as POST /profiles/, and a full hashing pool answers 503."""
+    def setUp(self):
+        self.profile_data = {
+            'user': {'username': 'testuser', 'email': 'testuser@example.com', 'password': 'testpassword'},
+            'gender': 'M',
+            'weight_unit': 'lb',
+            'height_unit': 'cm',
+            'weight': '154',
+            'height': '170',
+            'activity_level': 'Sedentary',
+            'age': 30
+        }
+
+    async def test_register(self):
+        response = await self.async_client.post('/profiles/register/', self.profile_data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['user'], {'username': 'testuser', 'email': 'testuser@example.com'})
+        profile = await Profile.objects.select_related('user').aget()
+        self.assertTrue(profile.user.check_password('testpassword'))
+        self.assertEqual(profile.TDEE, profile.calculate_tdee())
+
+    async def test_invalid_payload(self):
+        self.profile_data['weight'] = 'heavy'
+        response = await self.async_client.post('/profiles/register/', self.profile_data, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weight', response.json())
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_QUEUE=0)
+    async def test_saturated_pool_returns_503(self):
+        _, slots = hashing.pool()
+        slots.acquire()  # a registration already hashing
+        try:
+            response = await self.async_client.post('/profiles/register/', self.profile_data, content_type='application/json')
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(await Profile.objects.aexists())
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_QUEUE=0)
+    async def test_cancelled_request_keeps_its_slot_until_the_hash_ends(self):
+        started, finish = threading.Event(), threading.Event()
+
+        def slow_hash(raw_password):
+            started.set()
+            finish.wait(5)
+            return raw_password
+
+        with mock.patch.object(hashing, 'make_password', slow_hash):
+            task = asyncio.ensure_future(hashing.hash_password('testpassword'))
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # the worker is still hashing, so the pool is still full
+            with self.assertRaises(hashing.PoolSaturated):
+                await hashing.hash_password('testpassword')
+            finish.set()
+            await asyncio.to_thread(hashing.pool()[0].submit(lambda: None).result, 5)
+            self.assertEqual(await hashing.hash_password('testpassword'), 'testpassword')
+
+
+class AsyncProfileViewTestCase(TestCase):
+    """the async views list, retrieve and update profiles like the DRF viewset does."""
+    def setUp(self):
+        self.profiles = [make_profile(index) for index in range(5)]
+
+    async def test_list_pages_newest_first(self):
+        response = await self.async_client.get('/profiles/async/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        usernames = [item['user']['username'] for item in body['results']]
+        while body['next']:
+            body = (await self.async_client.get(body['next'])).json()
+            usernames += [item['user']['username'] for item in body['results']]
+        expected = (await sync_to_async(self.client.get)('/profiles/', {'page_size': 5})).json()['results']
+        self.assertEqual(usernames, [item['user']['username'] for item in expected])
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get('/profiles/async/', {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_retrieve_matches_viewset(self):
+        pk = self.profiles[0].pk
+        response = await self.async_client.get(f'/profiles/async/{pk}/')
+        self.assertEqual(response.status_code, 200)
+        expected = await sync_to_async(self.client.get)(f'/profiles/{pk}/')
+        self.assertEqual(response.json(), expected.json())
+        response = await self.async_client.get('/profiles/async/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_partial_update(self):
+        pk = self.profiles[0].pk
+        response = await self.async_client.patch(
+            f'/profiles/async/{pk}/', {'weight': 80, 'weight_unit': 'kg'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        profile = await Profile.objects.aget(pk=pk)
+        self.assertEqual(profile.weight, 80)
+        self.assertEqual(response.json()['TDEE'], profile.TDEE)
+
+        response = await self.async_client.patch(f'/profiles/async/{pk}/', {'weight': 'heavy'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RequestTimingTestCase(TestCase):
+    """every request gets a Server-Timing header, and /metrics has histograms per route and method."""
+    def setUp(self):
+        for histogram in instrumentation.HISTOGRAMS:
+            histogram.clear()
+        make_profile(0)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/profiles/')
+        entries = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        for phase in ('db', 'auth', 'serializer', 'view', 'render', 'total'):
+            self.assertIn(phase, entries)
+        self.assertIn('desc="1 queries"', entries['db'])
+
+    def test_password_hashing_is_timed(self):
+        response = self.client.post('/profiles/', {
+            'user': {'username': 'timed', 'email': 'timed@example.com', 'password': 'testpassword'},
+            'gender': 'F', 'weight_unit': 'kg', 'height_unit': 'cm', 'weight': 60, 'height': 165,
+            'activity_level': 'Sedentary', 'age': 30,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('hash;dur=', response['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.get('/profiles/')
+        self.client.get('/profiles/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('http_request_duration_seconds_count{route="profile-list",method="GET"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{route="profile-list",method="GET",le="1"} 2', body)
+        self.assertIn('http_request_phase_duration_seconds_count{route="profile-list",method="GET",phase="db"} 2', body)
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+    async def test_async_view_queries_are_counted(self):
+        response = await self.async_client.get('/profiles/async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+async def sleep_view(request):
+    await asyncio.sleep(0.2)
+    return HttpResponse()
+
+
+# for AsyncMiddlewareTestCase, the full MIDDLEWARE in front of one async view
+urlpatterns = [path('sleep/', sleep_view)]
+
+
+@override_settings(ROOT_URLCONF='users.tests')
+class AsyncMiddlewareTestCase(TestCase):
+    """
+    under ASGI the middleware stack stays async, so concurrent requests to an async view overlap instead of queueing on one thread."""
+    async def test_concurrent_requests_overlap(self):
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(self.async_client.get('/sleep/') for _ in range(4)))
+        elapsed = time.perf_counter() - start
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+        self.assertIn('total;dur=', responses[0]['Server-Timing'])
+        # one at a time would take 0.8s
+        self.assertLess(elapsed, 0.5)
+
+
+class RequestProfilingTestCase(TestCase):
+    """a signed header (or sampling) profiles a request, and only the newest profiles are kept."""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        overridden = override_settings(REQUEST_PROFILING_DIR=self.directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        make_profile(0)
+
+    def test_signed_header_profiles_the_request(self):
+        response = self.client.get('/profiles/', HTTP_X_PROFILE_REQUEST=profiling.issue_token())
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-File']
+        self.assertTrue(name.endswith('-get-profile-list.prof'))
+        self.assertEqual([path.name for path in profiling.stored_profiles()], [name])
+
+        out = StringIO()
+        call_command('request_profiles', 'show', 'latest', '--filter', 'serializers', stdout=out)
+        self.assertIn('to_representation', out.getvalue())
+
+    def test_bad_token_is_ignored(self):
+        response = self.client.get('/profiles/', HTTP_X_PROFILE_REQUEST='profile:forged:signature')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(profiling.stored_profiles(), [])
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_MAX_FILES=2)
+    def test_ring_keeps_the_newest(self):
+        names = [self.client.get('/profiles/')['X-Profile-File'] for _ in range(3)]
+        self.assertEqual([path.name for path in profiling.stored_profiles()], names[1:])
+
+        out = StringIO()
+        call_command('request_profiles', 'list', stdout=out)
+        self.assertIn('2 profiles', out.getvalue())
+
+    async def test_async_requests_pass_through(self):
+        response = await self.async_client.get('/profiles/', headers={'X-Profile-Request': profiling.issue_token()})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+
+
+class ProfileReadSerializerTestCase(TestCase):
+    """the values()-based read serializer gives exactly what ProfileSerializer gives for the same profile."""
+    def test_same_output_as_profile_serializer(self):
+        make_profile(0)
+        make_profile(1, gender='F', body_fat=21.5, activity_level='Very Active')
+        make_profile(2, weight_unit='lb', weight=180, height_unit='ft', height_feet=5, height_inches=11)
+        instances = Profile.objects.select_related('user').order_by('pk')
+        rows = Profile.objects.order_by('pk').values(*ProfileReadSerializer.columns())
+        expected = json.dumps(ProfileSerializer(instances, many=True).data)
+        self.assertEqual(json.dumps(ProfileReadSerializer(rows, many=True).data), expected)
+
+    def test_retrieve_uses_one_query(self):
+        profile = make_profile(0)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/profiles/{profile.pk}/')
+        self.assertEqual(response.json(), json.loads(json.dumps(ProfileSerializer(profile).data)))
+
+
+class SparseFieldsetTestCase(TestCase):
+    """?fields= and ?exclude= trim the profile output and the columns loaded for it."""
+    def setUp(self):
+        self.profile = make_profile(0)
+
+    def test_fields_skip_the_user_join(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/profiles/', {'fields': 'TDEE,weight,height,updated_at'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['results'][0]), ['weight', 'height', 'TDEE', 'updated_at'])
+        sql = captured[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"activity_level"', sql)
+
+    def test_retrieve_with_user_field(self):
+        response = self.client.get(f'/profiles/{self.profile.pk}/', {'fields': 'user,age'})
+        self.assertEqual(response.json(), {'user': {'username': 'member0', 'email': 'member0@example.com'}, 'age': 20})
+
+    def test_exclude(self):
+        response = self.client.get(f'/profiles/{self.profile.pk}/', {'exclude': 'user,created_at'})
+        full = self.client.get(f'/profiles/{self.profile.pk}/').json()
+        del full['user'], full['created_at']
+        self.assertEqual(response.json(), full)
+
+    def test_unknown_field(self):
+        response = self.client.get('/profiles/', {'fields': 'TDEE,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['fields'][0])
+
+
+class ApiSettingsStartupTestCase(TestCase):
+    """API workers on drf_api.settings_api start within the import budget and never load the apps they drop."""
+    # seconds for settings, django.setup(), the URLconf and the WSGI handler in a fresh interpreter. Generous on
+    # purpose (it measures about 0.5s locally), it is there to catch something heavy being imported at startup.
+    budget = 2.5
+
+    def test_startup_budget(self):
+        lean = measure_startup('drf_api.settings_api')
+        self.assertLess(lean['seconds'], self.budget)
+        for package in ('allauth', 'cloudinary', 'cloudinary_storage'):
+            self.assertNotIn(package, lean['loaded'])
+        self.assertLess(lean['modules'], measure_startup('drf_api.settings')['modules'])
+
+
+class StatelessJWTAuthenticationTestCase(TestCase):
+    """JWT requests authenticate from the token claims and a cached token version, and a version bump revokes them."""
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('jwtuser', 'jwtuser@example.com', 'testpassword', is_staff=True)
+        self.authentication = StatelessJWTCookieAuthentication()
+
+    def authenticate(self):
+        return self.authenticate_token(VersionedTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def test_no_user_query_once_version_is_cached(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'jwtuser', True))
+        self.assertEqual(user, self.user)
+
+    def test_other_fields_load_the_row(self):
+        user = self.authenticate()
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'jwtuser@example.com')
+            self.assertEqual(user.date_joined, self.user.date_joined)
+
+    def test_writes_reach_the_saved_row(self):
+        user = self.authenticate()
+        user.email = 'changed@example.com'
+        user.username = 'renamed'
+        user.save()
+        self.assertEqual((user.email, user.username), ('changed@example.com', 'renamed'))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.email, self.user.username), ('changed@example.com', 'renamed'))
+
+    def authenticate_token(self, token):
+        request = APIRequestFactory().get('/profiles/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.authentication.authenticate(request)[0]
+
+    def test_revoked_and_inactive(self):
+        old = VersionedTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authenticate_token(old)
+        self.user.revoke_tokens()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token(old)
+        self.authenticate()  # new tokens carry the new version
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_password_change_revokes(self):
+        old = VersionedTokenObtainPairSerializer.get_token(self.user).access_token
+        self.authenticate_token(old)
+        # the form dj_rest_auth's password change view saves with, for the logged-in user
+        form = SetPasswordForm(self.user, {'new_password1': 'anotherpassword1', 'new_password2': 'anotherpassword1'})
+        self.assertTrue(form.is_valid())
+        form.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate_token(old)
+        self.user.refresh_from_db()
+        self.authenticate()  # new tokens carry the new version
+
+
+@skipUnless('replica1' in settings.DATABASES, 'needs the replica1 alias from DEV or DATABASE_REPLICA_URLS')
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """profile list and retrieve read from a replica, everything else and a client that just wrote use the primary."""
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        self.profile = make_profile(0)
+
+    def queries(self, method, path, **extra):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica1']) as replica:
+                response = getattr(self.client, method)(path, content_type='application/json', **extra)
+        self.assertLess(response.status_code, 400)
+        return response, len(primary), len(replica)
+
+    def test_list_and_retrieve_read_from_replica(self):
+        for path in ('/profiles/', f'/profiles/{self.profile.pk}/'):
+            _, primary, replica = self.queries('get', path)
+            self.assertEqual((primary, replica), (0, 1))
+
+    def test_other_reads_stay_on_primary(self):
+        _, primary, replica = self.queries('get', f'/profiles/{self.profile.pk}/metrics/')
+        self.assertEqual(replica, 0)
+
+    def test_client_sticks_to_primary_after_write(self):
+        response, _, replica = self.queries('patch', f'/profiles/{self.profile.pk}/', data={'age': 31})
+        self.assertEqual(replica, 0)
+        cookie = response.cookies[settings.DATABASE_STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DATABASE_REPLICA_STICKY_SECONDS)
+        self.assertEqual((cookie['samesite'], cookie['secure']), ('None', True))
+        _, primary, replica = self.queries('get', f'/profiles/{self.profile.pk}/')
+        self.assertEqual((primary, replica), (1, 0))
+
+        del self.client.cookies[settings.DATABASE_STICKY_COOKIE]  # the window has passed
+        _, primary, replica = self.queries('get', f'/profiles/{self.profile.pk}/')
+        self.assertEqual((primary, replica), (0, 1))
+
+    def test_unsafe_request_without_writes_does_not_stick(self):
+        response, primary, replica = self.queries('post', '/profiles/calculate/', data=[
+            {'gender': 'F', 'age': 30, 'activity_level': 'Sedentary', 'weight': 60, 'height': 165},
+        ])
+        self.assertEqual((primary, replica), (0, 0))
+        self.assertNotIn(settings.DATABASE_STICKY_COOKIE, response.cookies)
+
+    def test_token_version_is_read_from_primary(self):
+        cache.clear()
+        token = use_replica.set(True)
+        try:
+            with CaptureQueriesContext(connections['default']) as primary:
+                with CaptureQueriesContext(connections['replica1']) as replica:
+                    self.assertEqual(current_token_version(self.profile.user_id), 0)
+        finally:
+            use_replica.reset(token)
+        self.assertEqual((len(primary), len(replica)), (1, 0))
+
+    def test_router_without_a_request(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Profile), 'default')
+        token = use_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Profile), 'replica1')
+            self.assertEqual(router.db_for_write(Profile), 'default')
+            # related rows come from wherever the instance was read
+            self.assertEqual(router.db_for_read(CustomUser, instance=self.profile), 'default')
+        finally:
+            use_replica.reset(token)
+        self.assertFalse(router.allow_migrate('replica1', 'users'))
+
+
+class ProfileFilterTestCase(TestCase):
+    """profile filters return the right rows, and each common combination is answered by an index search."""
+    def setUp(self):
+        self.profiles = [
+            make_profile(0, gender='F', age=25, activity_level='Sedentary'),
+            make_profile(1, gender='F', age=35, activity_level='Very Active'),
+            make_profile(2, gender='M', age=35, activity_level='Very Active'),
+            make_profile(3, gender='M', age=50, activity_level='Sedentary'),
+        ]
+
+    def usernames(self, params):
+        response = self.client.get('/profiles/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['user']['username'] for item in response.json()['results'])
+
+    def plan(self, params):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get('/profiles/', params).status_code, 200)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + captured[0]['sql'])
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def test_filters(self):
+        self.assertEqual(self.usernames({'activity_level': 'Very Active'}), ['member1', 'member2'])
+        self.assertEqual(self.usernames({'gender': 'F', 'age_min': 30}), ['member1'])
+        self.assertEqual(self.usernames({'age_min': 30, 'age_max': 40}), ['member1', 'member2'])
+        tdee = sorted(profile.TDEE for profile in self.profiles)
+        self.assertEqual(len(self.usernames({'TDEE_min': tdee[1], 'TDEE_max': tdee[2]})), 2)
+        self.assertEqual(self.usernames({'username': 'member3'}), ['member3'])
+        self.assertEqual(self.usernames({'username': 'Member'}), [])
+        self.assertEqual(self.client.get('/profiles/', {'gender': 'X'}).status_code, 400)
+
+    def test_ordering(self):
+        Profile.objects.filter(pk=self.profiles[0].pk).update(updated_at=timezone.now())
+        response = self.client.get('/profiles/', {'ordering': '-updated_at', 'page_size': 2})
+        first = response.json()
+        second = self.client.get(first['next']).json()
+        usernames = [item['user']['username'] for item in first['results'] + second['results']]
+        self.assertEqual(usernames, ['member0', 'member3', 'member2', 'member1'])
+        # heavily tied or unindexed columns would page with offsets, so they aren't offered
+        default = self.client.get('/profiles/').json()['results']
+        for field in ('age', '-weight', 'TDEE'):
+            self.assertEqual(self.client.get('/profiles/', {'ordering': field}).json()['results'], default)
+
+    def test_null_tdee_rows_are_not_lost_between_pages(self):
+        for index in range(4, 30):
+            make_profile(index)
+        Profile.objects.filter(pk__in=[profile.pk for profile in self.profiles[:3]]).update(TDEE=None)
+        # TDEE isn't orderable (a NULL can't be a cursor position), so this pages in the default order
+        response = self.client.get('/profiles/', {'ordering': '-TDEE', 'page_size': 5}).json()
+        usernames = [item['user']['username'] for item in response['results']]
+        while response['next']:
+            response = self.client.get(response['next']).json()
+            usernames += [item['user']['username'] for item in response['results']]
+        self.assertEqual(sorted(usernames), sorted(f'member{index}' for index in range(30)))
+
+    @skipUnless(connection.vendor == 'sqlite', 'the plans below are SQLite EXPLAIN QUERY PLAN output')
+    def test_query_plans(self):
+        plans = [
+            (r'profile_activity_created_idx \(activity_level=\?\)', {'activity_level': 'Sedentary'}),
+            (
+                r'profile_activity_tdee_idx \(activity_level=\? AND TDEE>\? AND TDEE<\?\)',
+                {'activity_level': 'Sedentary', 'TDEE_min': 1500, 'TDEE_max': 2500},
+            ),
+            (r'profile_gender_age_idx \(gender=\? AND age>\? AND age<\?\)', {'gender': 'F', 'age_min': 30, 'age_max': 40}),
+            (r'profile_tdee_idx \(TDEE>\? AND TDEE<\?\)', {'TDEE_min': 1500, 'TDEE_max': 2500}),
+        ]
+        for index, params in plans:
+            self.assertRegex(self.plan(params), 'SEARCH users_profile USING INDEX ' + index)
+        # the prefix is a range on the unique username index, then one profile lookup per user
+        self.assertRegex(
+            self.plan({'username': 'mem'}), r'SEARCH users_customuser USING INDEX \S+ \(username>\? AND username<\?\)'
+        )
+        # ordering by updated_at walks the (updated_at, id) index instead of sorting
+        self.assertNotIn('TEMP B-TREE', self.plan({'ordering': 'updated_at'}))
+
+
+class ProfileStatsTestCase(TestCase):
+    """
+    the stats summary follows every kind of profile write without a rebuild, and /profiles/stats/ answers from it alone."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profiles = [
+            make_profile(index, gender='MF'[index % 2], age=20 + index * 3, activity_level=level)
+            for index, level in enumerate(['Sedentary', 'Very Active'] * 5)
+        ]
+
+    def stored(self):
+        return {
+            row[:-2]: [row[-2], round(row[-1], 6)]
+            for row in ProfileStatsBucket.objects.exclude(count=0).values_list(*ProfileStatsBucket.KEY_FIELDS, 'count', 'total')
+        }
+
+    maxDiff = None
+
+    def assertMatchesScan(self):
+        expected = {key: [count, round(total, 6)] for key, (count, total) in stats.scan(Profile.objects.all()).items()}
+        self.assertEqual(self.stored(), expected)
+        call_command('rebuild_profile_stats', check=True, stdout=StringIO())
+
+    def test_incremental_updates_match_a_full_scan(self):
+        self.assertMatchesScan()
+        profile = self.profiles[0]
+        profile.weight = 95
+        profile.waist_measurement = 90
+        profile.hip_measurement = 70
+        profile.save()
+        self.assertMatchesScan()
+
+        # a deferred load has no snapshot, the save reads the old values itself
+        profile = Profile.objects.only('id', 'user').get(pk=self.profiles[1].pk)
+        profile.age = 64
+        profile.save()
+        self.assertMatchesScan()
+
+        self.profiles[2].delete()
+        self.profiles[3].user.delete()
+        self.assertMatchesScan()
+
+        response = self.client.post('/profiles/bulk/', [{
+            'user': {'username': f'bulk{index}', 'email': f'bulk{index}@example.com', 'password': 'testpassword'},
+            'gender': 'F', 'weight_unit': 'kg', 'height_unit': 'cm', 'weight': '60', 'height': '165',
+            'activity_level': 'Lightly Active', 'age': 28,
+        } for index in range(3)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertMatchesScan()
+
+        # queryset updates skip the summary, so rebuild after one
+        Profile.objects.update(TDEE=None)
+        call_command('rebuild_profile_stats', stdout=StringIO())
+        call_command('recompute_tdee', chunk_size=4, stdout=StringIO())
+        self.assertMatchesScan()
+
+    def test_backends_without_upsert_match_a_full_scan(self):
+        with mock.patch.object(ProfileStatsBucketManager, 'upsert_vendors', ()):
+            self.test_incremental_updates_match_a_full_scan()
+
+    def test_check_reports_drift_and_rebuild_fixes_it(self):
+        ProfileStatsBucket.objects.filter(metric='TDEE').update(count=models.F('count') + 1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_profile_stats', check=True, stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_profile_stats', stdout=StringIO())
+        self.assertMatchesScan()
+
+    def test_endpoint(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/profiles/stats/', {'group_by': 'activity_level', 'percentiles': '50'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['metric'], 'TDEE')
+        self.assertEqual(body['bin_width'], stats.BIN_WIDTHS['TDEE'])
+        self.assertEqual([group['activity_level'] for group in body['groups']], ['Sedentary', 'Very Active'])
+        for group in body['groups']:
+            values = sorted(
+                profile.TDEE for profile in self.profiles if profile.activity_level == group['activity_level']
+            )
+            self.assertEqual(group['count'], len(values))
+            self.assertAlmostEqual(group['mean'], sum(values) / len(values))
+            self.assertLessEqual(abs(group['percentiles']['p50'] - values[len(values) // 2]), body['bin_width'])
+
+        response = self.client.get('/profiles/stats/', {'group_by': '', 'gender': 'F', 'age_bucket': 20})
+        self.assertEqual(response.json()['groups'][0]['count'], sum(
+            1 for profile in self.profiles if profile.gender == 'F' and 20 <= profile.age < 30
+        ))
+        self.assertEqual(self.client.get('/profiles/stats/', {'group_by': 'weight'}).status_code, 400)
+        self.assertEqual(self.client.get('/profiles/stats/', {'percentiles': '101'}).status_code, 400)
+
+
+@override_settings(PROFILE_SYNC_SAFETY_LAG=0)
+class ProfileChangesTestCase(TestCase):
+    """
+    delta sync hands out every create, update and delete exactly once across pages, and reads only what changed."""
+    def setUp(self):
+        self.client = APIClient()
+        self.profiles = [make_profile(index) for index in range(5)]
+
+    def sync(self, since=None, limit=2):
+        changed, deleted = [], []
+        while True:
+            params = {'limit': limit}
+            if since is not None:
+                params['since'] = since
+            response = self.client.get('/profiles/changes/', params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            changed += [item['id'] for item in body['changed']]
+            deleted += body['deleted']
+            since = body['since']
+            if not body['more']:
+                return changed, deleted, since
+
+    def test_sync_round_trip(self):
+        changed, deleted, since = self.sync()
+        self.assertEqual(sorted(changed), sorted(profile.pk for profile in self.profiles))
+        self.assertEqual(deleted, [])
+        self.assertEqual(self.sync(since)[:2], ([], []))
+
+        self.profiles[1].age = 60
+        self.profiles[1].save()
+        new = make_profile(10)
+        removed = [self.profiles[2].pk, self.profiles[3].pk]
+        self.profiles[2].delete()
+        self.profiles[3].user.delete()
+        changed, deleted, since = self.sync(since, limit=1)
+        self.assertEqual(changed, [self.profiles[1].pk, new.pk])
+        self.assertEqual(sorted(deleted), sorted(removed))
+        self.assertEqual(self.sync(since)[:2], ([], []))
+
+    def test_cost_follows_changes(self):
+        since = self.sync(limit=100)[2]
+        self.profiles[0].save()
+        # one range scan of each table
+        with self.assertNumQueries(2):
+            body = self.client.get('/profiles/changes/', {'since': since}).json()
+        self.assertEqual([item['id'] for item in body['changed']], [self.profiles[0].pk])
+
+    @override_settings(PROFILE_SYNC_SAFETY_LAG=60)
+    def test_late_commits_are_not_skipped(self):
+        now = timezone.now()
+        Profile.objects.update(updated_at=now - timezone.timedelta(hours=1))
+        Profile.objects.filter(pk=self.profiles[0].pk).update(updated_at=now - timezone.timedelta(seconds=5))
+        changed, _, since = self.sync(limit=100)
+        # inside the lag, it waits for a later call
+        self.assertNotIn(self.profiles[0].pk, changed)
+        self.assertEqual(len(changed), 4)
+
+        # a transaction stamped before that watermark was issued commits after it
+        late = make_profile(10)
+        Profile.objects.filter(pk=late.pk).update(updated_at=now - timezone.timedelta(seconds=30))
+        removed = self.profiles[1].pk
+        self.profiles[1].delete()
+        ProfileTombstone.objects.update(deleted_at=now - timezone.timedelta(seconds=20))
+
+        with mock.patch('django.utils.timezone.now', return_value=now + timezone.timedelta(seconds=60)):
+            changed, deleted, _ = self.sync(since, limit=100)
+        self.assertEqual(changed, [late.pk, self.profiles[0].pk])
+        self.assertEqual(deleted, [removed])
+
+    @skipUnless(connection.vendor == 'sqlite', 'the plans below are SQLite EXPLAIN QUERY PLAN output')
+    def test_query_plans(self):
+        self.profiles[4].delete()
+        since = self.sync(limit=100)[2]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/profiles/changes/', {'since': since})
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        self.assertRegex(
+            plans[0], r'SEARCH users_profile USING INDEX profile_updated_id_idx \(updated_at>\? AND updated_at<\?\)'
+        )
+        self.assertRegex(
+            plans[1],
+            r'SEARCH users_profiletombstone USING INDEX tombstone_deleted_id_idx \(deleted_at>\? AND deleted_at<\?\)',
+        )
+        self.assertNotIn('TEMP B-TREE', '\n'.join(plans))
+
+    def test_bad_and_expired_watermarks(self):
+        self.assertEqual(self.client.get('/profiles/changes/', {'since': 'forged'}).status_code, 400)
+        since = self.sync()[2]
+        with override_settings(PROFILE_SYNC_WATERMARK_MAX_AGE=-1):
+            self.assertEqual(self.client.get('/profiles/changes/', {'since': since}).status_code, 410)
+
+    def test_prune_keeps_recent_tombstones(self):
+        removed = self.profiles[0].pk
+        self.profiles[0].delete()
+        ProfileTombstone.objects.create(profile_id=999, deleted_at=timezone.now() - timezone.timedelta(days=365))
+        call_command('prune_profile_tombstones', stdout=StringIO())
+        self.assertEqual(list(ProfileTombstone.objects.values_list('profile_id', flat=True)), [removed])
+
+
+class CalculateTestCase(TestCase):
+    """
+    the calculator gives the numbers a saved profile would get for the same measurements, without touching the database."""
+    def setUp(self):
+        self.client = APIClient()
+        self.items = [
+            {'gender': 'F', 'age': 28, 'activity_level': 'Lightly Active', 'weight': '132', 'weight_unit': 'lb',
+             'height_unit': 'ft', 'height_feet': 5, 'height_inches': 0},
+            {'gender': 'M', 'age': 45, 'activity_level': 'Very Active', 'weight': 81.5, 'height': 178.2,
+             'waist_measurement': 90, 'hip_measurement': 70},
+            {'gender': 'O', 'age': 33, 'activity_level': 'Sedentary', 'weight': 60, 'weight_unit': 'kg',
+             'height': '165', 'height_unit': 'cm', 'body_fat': 22.5},
+        ]
+
+    def test_matches_profile_calculations(self):
+        with self.assertNumQueries(0):
+            response = self.client.post('/profiles/calculate/', self.items, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        for item, result in zip(self.items, results):
+            profile = Profile(**{field: value for field, value in item.items() if field in (
+                'gender', 'age', 'activity_level', 'weight', 'weight_unit', 'height', 'height_unit', 'height_feet',
+                'height_inches',
+            )})
+            profile.normalize_measurements()
+            self.assertEqual(result['bmr'], profile.calculate_bmr())
+            self.assertEqual(result['tdee'], profile.TDEE)
+        self.assertIsNone(results[0]['body_fat'])
+        self.assertEqual(results[1]['body_fat'], ProfileSerializer().calculate_body_fat(90, 70))
+        self.assertEqual(results[2]['body_fat'], 22.5)
+        self.assertEqual(Profile.objects.count(), 0)
+
+    def test_waist_and_hip_override_body_fat_like_a_profile(self):
+        item = dict(
+            self.items[1], weight_unit='kg', height_unit='cm', body_fat=15.0, waist_measurement=100, hip_measurement=75,
+        )
+        result = self.client.post('/profiles/calculate/', [item], format='json').json()['results'][0]
+        self.assertEqual(result['body_fat'], 25.0)
+
+        response = self.client.post('/profiles/', dict(item, user={
+            'username': 'calculated', 'email': 'calculated@example.com', 'password': 'testpassword',
+        }), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Profile.objects.get().body_fat, result['body_fat'])
+
+    def test_errors_are_reported_per_index(self):
+        self.items[0]['height_feet'] = None
+        self.items[1]['hip_measurement'] = None
+        self.items[2]['weight'] = 'heavy'
+        self.items.append('not an object')
+        response = self.client.post('/profiles/calculate/', self.items, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = {error['index']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(list(errors), [0, 1, 2, 3])
+        self.assertIn('height_feet', errors[0])
+        self.assertIn('non_field_errors', errors[1])
+        self.assertIn('weight', errors[2])
+        self.assertEqual(self.client.post('/profiles/calculate/', {}, format='json').status_code, 400)
+        self.assertEqual(
+            self.client.post('/profiles/calculate/', self.items[2:3] * 10001, format='json').status_code, 400
+        )
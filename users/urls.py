@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import AsyncProfileDetailView, AsyncProfileListView, register
 from .views import ProfileViewSet
 
 router = DefaultRouter()
 router.register(r'', ProfileViewSet, basename='profile')
 
 urlpatterns = [
+    path('register/', register, name='profile-register'),
+    path('async/', AsyncProfileListView.as_view(), name='async-profile-list'),
+    path('async/<int:pk>/', AsyncProfileDetailView.as_view(), name='async-profile-detail'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
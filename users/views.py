@@ -1,11 +1,274 @@
-from rest_framework import viewsets
-from .models import Profile
-from .serializers import ProfileSerializer
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from rest_framework import permissions, serializers, status, viewsets
+from rest_framework.decorators import action
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_api.instrumentation import TimedAuthenticationMixin
+from . import calculator, conditional, export, stats, sync
+from . import metrics as profile_metrics
+from .models import Profile, ProfileStatsBucket
+from .filters import ProfileFilter, ProfileOrderingFilter
+from .pagination import ProfileCursorPagination
+from .serializers import ChangesQuerySerializer, ProfileReadSerializer, ProfileSerializer, StatsQuerySerializer
 from rest_framework.response import Response
 
 
-class ProfileViewSet(viewsets.ModelViewSet):
-    queryset = Profile.objects.all()
+class ProfileViewSet(TimedAuthenticationMixin, viewsets.ModelViewSet):
+    queryset = Profile.objects.order_by('pk')
     serializer_class = ProfileSerializer
+    pagination_class = ProfileCursorPagination
+    filter_backends = [DjangoFilterBackend, ProfileOrderingFilter]
+    filterset_class = ProfileFilter
+    # cursor pagination carries on from the first ordering column and steps through equal values with an offset, so
+    # only indexed, near-unique columns that are never NULL keep pages constant-cost (not age, weight or TDEE)
+    ordering_fields = ('created_at', 'updated_at', 'id')
+    ordering = ProfileCursorPagination.ordering
+    bulk_max_items = 1000
+    calculate_max_items = 10000
+    # may read from a replica, see drf_api/db_routers.py
+    replica_actions = ('list', 'retrieve')
 
-    
+    def retrieve(self, request, *args, **kwargs):
+        if conditional.is_conditional(request):
+            try:
+                rows = list(
+                    self.filter_queryset(self.get_queryset())
+                    .filter(pk=kwargs[self.lookup_url_kwarg or self.lookup_field])
+                    .values_list('pk', 'updated_at')
+                )
+            except (TypeError, ValueError):
+                rows = []  # malformed pk, get_object below turns it into a 404
+            if rows:
+                response = conditional.not_modified(request, *conditional.validators(request, rows))
+                if response is not None:
+                    return response
+
+        row = self.get_object()
+        response = Response(self.get_serializer(row).data)
+        etag, last_modified = conditional.validators(request, [(row['id'], row['updated_at'])])
+        return conditional.set_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        if conditional.is_conditional(request) and self.pagination_class is not None:
+            # run the same pagination over (id, updated_at) only, a fresh paginator keeps self.paginator untouched
+            queryset = self.filter_queryset(self.get_queryset())
+            paginator = self.pagination_class()
+            ordering = [field.lstrip('-') for field in paginator.get_ordering(request, queryset, self)]
+            page = paginator.paginate_queryset(queryset.values('pk', 'updated_at', *ordering), request, view=self)
+            rows = [(row['pk'], row['updated_at']) for row in page]
+            response = conditional.not_modified(request, *conditional.validators(request, rows))
+            if response is not None:
+                return response
+
+        response = super().list(request, *args, **kwargs)
+        if self.paginator is not None and response.status_code == 200:
+            rows = [(row['id'], row['updated_at']) for row in self.paginator.page]
+            conditional.set_validators(response, *conditional.validators(request, rows))
+        return response
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # plain dicts, writes keep model instances
+            columns = ProfileReadSerializer.columns(self.requested_fields)
+            # cursor pagination reads its position from the ordering columns
+            ordering = ProfileOrderingFilter().get_ordering(self.request, queryset, self)
+            columns += [field.lstrip('-') for field in ordering if field.lstrip('-') not in columns]
+            queryset = queryset.values(*columns)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve'):
+            return ProfileReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self.requested_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    @cached_property
+    def requested_fields(self):
+        """
+        Sparse fieldsets for list and retrieve: ?fields=TDEE,weight keeps only those keys, ?exclude=user drops keys.
+        None means every field.
+        """
+        known = ProfileReadSerializer.field_names()
+        selected = None
+        errors = {}
+        for param in ('fields', 'exclude'):
+            if param not in self.request.query_params:
+                continue
+            names = [name.strip() for name in self.request.query_params[param].split(',') if name.strip()]
+            unknown = [name for name in names if name not in known]
+            if not names:
+                errors[param] = ['Expected a comma-separated list of field names.']
+            elif unknown:
+                errors[param] = [f'Unknown field(s): {", ".join(unknown)}. Choose from {", ".join(known)}.']
+            elif param == 'fields':
+                selected = set(names)
+            else:
+                selected = (set(known) if selected is None else selected) - set(names)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return selected
+
+    @action(detail=True)
+    def metrics(self, request, pk=None):
+        """
+        GET /profiles/{id}/metrics/ returns BMR, TDEE, calorie targets per goal and body composition, from the cache
+        when possible. A hit doesn't touch the database.
+        """
+        try:
+            cached = profile_metrics.get_cached(int(pk))
+        except ValueError:
+            cached = None
+        if cached is not None:
+            return Response(cached)
+        return Response(profile_metrics.store(self.get_object()))
+
+    @action(detail=False, url_path='metrics/stats')
+    def metrics_stats(self, request):
+        """GET /profiles/metrics/stats/ returns the metrics cache hit and miss counters."""
+        return Response(profile_metrics.stats())
+
+    @action(detail=False)
+    def stats(self, request):
+        """
+        GET /profiles/stats/?metric=TDEE|body_fat&group_by=activity_level,gender,age_bucket&percentiles=25,50,75,90
+        returns count, mean and percentiles per group, optionally narrowed with activity_level, gender and age_bucket.
+        Reads only the ProfileStatsBucket summary (users/stats.py), never the profiles themselves.
+        """
+        query = StatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        metric = query.validated_data['metric']
+        group_by = query.validated_data['group_by']
+        filters = {field: query.validated_data[field] for field in stats.GROUP_FIELDS if field in query.validated_data}
+
+        groups = {}
+        buckets = (
+            ProfileStatsBucket.objects.filter(metric=metric, count__gt=0, **filters)
+            .values_list(*group_by, 'bin', 'count', 'total')
+        )
+        for row in buckets:
+            groups.setdefault(row[:len(group_by)], []).append(row[len(group_by):])
+        results = []
+        for group in sorted(groups):
+            summary = stats.summarize(metric, groups[group], query.validated_data['percentiles'])
+            if summary is not None:
+                results.append({**dict(zip(group_by, group)), **summary})
+        return Response({'metric': metric, 'bin_width': stats.BIN_WIDTHS[metric], 'groups': results})
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        GET /profiles/changes/?since=<watermark>&limit=500 returns the profiles created or updated and the ids of the
+        profiles deleted since the watermark, with the next watermark. Call again with it while `more` is true. Leaving
+        since out starts from scratch; an expired watermark answers 410 and the client has to start from scratch.
+        See users/sync.py.
+        """
+        try:
+            query = ChangesQuerySerializer(data=request.query_params)
+            query.is_valid(raise_exception=True)
+        except sync.ExpiredWatermark:
+            return Response(
+                {'detail': 'The watermark has expired, download the profiles again without since.'},
+                status=status.HTTP_410_GONE
+            )
+        changed, deleted, watermark, more = sync.changes(
+            query.validated_data.get('since'), query.validated_data['limit'], ProfileReadSerializer.columns()
+        )
+        return Response({
+            # the profile fields don't include the id, clients need it to merge
+            'changed': [
+                {'id': row['id'], **data} for row, data in zip(changed, ProfileReadSerializer(changed, many=True).data)
+            ],
+            'deleted': deleted,
+            'since': watermark,
+            'more': more,
+        })
+
+    @action(detail=False, methods=['post'], authentication_classes=[], permission_classes=[permissions.AllowAny])
+    def calculate(self, request):
+        """
+        POST /profiles/calculate/ with a list of measurements (the profile fields: gender, age, activity_level, weight
+        and weight_unit, height or height_feet/height_inches with height_unit, optional body_fat, optional waist and
+        hip measurements that override it) returns BMR, TDEE and body fat for each, in order. Nothing is stored and no
+        login is needed. Any invalid item rejects the batch, with errors per index like /profiles/bulk/. See
+        users/calculator.py.
+        """
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of measurements.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.calculate_max_items:
+            return Response(
+                {'detail': f'A batch can hold at most {self.calculate_max_items} items.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        columns, errors = calculator.parse(request.data)
+        if errors:
+            return Response({'results': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': calculator.calculate(columns), 'errors': []})
+
+    @action(detail=False, permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """
+        GET /profiles/export/?output=ndjson|csv&since=<ISO datetime> streams every profile changed since `since`
+        (inclusive), oldest change first. Staff only.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise serializers.ValidationError({'output': f'Must be one of {", ".join(export.FORMATS)}.'})
+        since = None
+        if 'since' in request.query_params:
+            since = serializers.DateTimeField().to_internal_value(request.query_params['since'])
+
+        response = StreamingHttpResponse(
+            export.encode(export.export_rows(since), output), content_type=export.CONTENT_TYPES[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="profiles.{output}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        POST /profiles/bulk/ with a list of the same payloads POST /profiles/ takes.
+        Every item is validated on its own so errors can be reported per index. By default one bad item rejects the
+        whole batch; with ?partial_success=true the valid items are written and the bad ones are reported back.
+        """
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of profiles.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.bulk_max_items:
+            return Response(
+                {'detail': f'A batch can hold at most {self.bulk_max_items} profiles.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        partial_success = request.query_params.get('partial_success', '').lower() in ('1', 'true', 'yes')
+
+        valid = []
+        errors = []
+        seen = {'username': set(), 'email': set()}
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+                continue
+            # the unique validators only look at the database, so duplicates inside the batch are caught here
+            user_data = serializer.validated_data['user']
+            duplicates = {
+                field: ['This value appears more than once in the batch.']
+                for field in seen if user_data[field] in seen[field]
+            }
+            if duplicates:
+                errors.append({'index': index, 'errors': {'user': duplicates}})
+                continue
+            for field in seen:
+                seen[field].add(user_data[field])
+            valid.append(serializer.validated_data)
+
+        if errors and (not partial_success or not valid):
+            return Response({'created': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        list_serializer = self.get_serializer(many=True)
+        profiles = list_serializer.create(valid)
+        created = self.get_serializer(profiles, many=True).data
+        return Response({'created': created, 'errors': errors}, status=status.HTTP_201_CREATED)